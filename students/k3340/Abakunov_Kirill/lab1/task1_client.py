@@ -2,21 +2,90 @@
 """
 Задание 1: UDP клиент
 Отправляет сообщение серверу и получает ответ
+
+С --flood N отправляет N датаграмм окнами по --window с --sockets
+сокетов (разные порты отправителя распределяются между воркерами
+сервера) и печатает число ответов и скорость.
 """
 
+import argparse
 import socket
+import threading
+import time
 
-def main():
-    # Создаем UDP сокет
+# Сколько ждать ответов на окно датаграмм (секунды)
+FLOOD_TIMEOUT = 1.0
+
+def flood_socket(server_address, count, window, message, results):
+    """Отправляет count датаграмм с одного сокета, ожидая ответы после каждого окна"""
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    client_socket.settimeout(FLOOD_TIMEOUT)
+    sent = 0
+    received = 0
+    try:
+        while sent < count:
+            burst = min(window, count - sent)
+            for _ in range(burst):
+                client_socket.sendto(message, server_address)
+            sent += burst
+            try:
+                for _ in range(burst):
+                    client_socket.recvfrom(1024)
+                    received += 1
+            except socket.timeout:
+                # Ответы на остальную часть окна потеряны
+                pass
+    finally:
+        client_socket.close()
+        results.append((sent, received))
+
+def flood(server_address, count, sockets, window, message):
+    """Нагрузочный режим: count датаграмм, поровну между sockets сокетами"""
+    results = []
+    threads = []
+    started = time.perf_counter()
+    for number in range(sockets):
+        share = count // sockets + (1 if number < count % sockets else 0)
+        thread = threading.Thread(target=flood_socket,
+                                  args=(server_address, share, window, message, results))
+        thread.start()
+        threads.append(thread)
+    for thread in threads:
+        thread.join()
+    elapsed = time.perf_counter() - started
+    
+    sent = sum(sent for sent, _ in results)
+    received = sum(received for _, received in results)
+    print(f"Отправлено: {sent}, получено ответов: {received}, потеряно: {sent - received}")
+    print(f"Время: {elapsed:.2f} с, {received / elapsed if elapsed else 0:.0f} ответов/с")
+
+def main():
+    parser = argparse.ArgumentParser(description="UDP клиент")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--flood', type=int, metavar='N',
+                        help="отправить N датаграмм и измерить скорость ответов")
+    parser.add_argument('--sockets', type=int, default=4,
+                        help="нагрузочный режим: сколько сокетов (портов отправителя) использовать")
+    parser.add_argument('--window', type=int, default=64,
+                        help="нагрузочный режим: сколько датаграмм отправлять, не дожидаясь ответов")
+    args = parser.parse_args()
     
     # Настройки сервера
-    host = 'localhost'
-    port = 9999
-    server_address = (host, port)
+    server_address = (args.host, args.port)
     
     # Отправляем сообщение серверу
     message = "Hello, server"
+    
+    if args.flood:
+        if args.sockets < 1 or args.window < 1:
+            parser.error("--sockets и --window должны быть положительными")
+        flood(server_address, args.flood, args.sockets, args.window, message.encode('utf-8'))
+        return
+    
+    # Создаем UDP сокет
+    client_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    
     print(f"Отправка сообщения серверу: {message}")
     client_socket.sendto(message.encode('utf-8'), server_address)
     
@@ -2,17 +2,268 @@
 """
 Задание 1: UDP сервер
 Принимает сообщение от клиента и отправляет ответ
+
+Режим --mode async рассчитан на большой поток датаграмм: сокет
+вычитывается пачками в один переиспользуемый буфер, журнал ограничен
+по частоте, а с --workers N порт делят N процессов через SO_REUSEPORT.
 """
 
+import argparse
+import asyncio
+import multiprocessing
+import os
 import socket
+import time
 
-def main():
-    # Создаем UDP сокет
+# Самая большая датаграмма UDP
+MAX_DATAGRAM_SIZE = 65535
+
+# Сколько датаграмм читать за одно пробуждение цикла событий
+RECV_BATCH = 256
+
+# Сколько строк журнала в секунду печатать в режиме async
+LOG_RATE = 10
+
+# Как часто печатать счетчики воркера (секунды, 0 - только при остановке)
+STATS_INTERVAL = 5.0
+
+# Пауза перед перезапуском воркера, упавшего сразу после старта
+RESPAWN_DELAY = 1.0
+
+RESPONSE = "Hello, client".encode('utf-8')
+
+class RateLimitedLog:
+    """Печатает не больше rate строк в секунду; об остальных сообщает числом"""
+    
+    def __init__(self, rate):
+        self.rate = rate
+        self.window = 0
+        self.printed = 0
+        self.suppressed = 0
+    
+    def enabled(self):
+        """Будет ли напечатана следующая строка (чтобы не форматировать зря)"""
+        now = int(time.monotonic())
+        if now != self.window:
+            if self.suppressed:
+                print(f"... пропущено строк журнала: {self.suppressed}")
+            self.window = now
+            self.printed = 0
+            self.suppressed = 0
+        if self.printed < self.rate:
+            self.printed += 1
+            return True
+        self.suppressed += 1
+        return False
+
+class WorkerStats:
+    """Счетчики воркера; при работе нескольких процессов копируются в общую память"""
+    
+    __slots__ = ('packets', 'bytes', 'send_dropped', 'slots', 'index')
+    
+    def __init__(self, slots=None, index=0):
+        self.packets = 0
+        self.bytes = 0
+        self.send_dropped = 0
+        # Общий массив (пакеты, байты) по воркерам и номер пары этого воркера
+        self.slots = slots
+        self.index = index
+    
+    def publish(self):
+        if self.slots is not None:
+            self.slots[2 * self.index] = self.packets
+            self.slots[2 * self.index + 1] = self.bytes
+
+class HelloProtocol(asyncio.DatagramProtocol):
+    """Отвечает на каждую датаграмму и считает пакеты и байты"""
+    
+    def __init__(self, stats, log):
+        self.stats = stats
+        self.log = log
+        self.transport = None
+    
+    def connection_made(self, transport):
+        self.transport = transport
+    
+    def datagram_received(self, data, addr):
+        # data - срез общего буфера приема, действителен только внутри вызова
+        self.stats.packets += 1
+        self.stats.bytes += len(data)
+        if self.log.enabled():
+            print(f"Получено от {addr}: {str(data, 'utf-8', 'replace')}")
+        self.transport.sendto(RESPONSE, addr)
+
+class BatchedDatagramTransport(asyncio.DatagramTransport):
+    """Датаграммный транспорт, вычитывающий сокет пачками.
+
+    Стандартный транспорт asyncio делает один recvfrom на пробуждение и
+    создает новый bytes на каждую датаграмму. Здесь за пробуждение читается
+    до RECV_BATCH датаграмм через recvfrom_into в один и тот же буфер, а
+    протокол получает memoryview на его участок. Ответ, который не влез в
+    буфер отправки, отбрасывается (UDP и так не гарантирует доставку).
+    """
+    
+    def __init__(self, loop, sock, protocol, stats):
+        super().__init__()
+        self.loop = loop
+        self.sock = sock
+        self.protocol = protocol
+        self.stats = stats
+        self.buffer = bytearray(MAX_DATAGRAM_SIZE)
+        self.view = memoryview(self.buffer)
+        self.closing = False
+        protocol.connection_made(self)
+        loop.add_reader(sock.fileno(), self._read_ready)
+    
+    def _read_ready(self):
+        for _ in range(RECV_BATCH):
+            try:
+                size, addr = self.sock.recvfrom_into(self.buffer)
+            except (BlockingIOError, InterruptedError):
+                break
+            except OSError as e:
+                self.protocol.error_received(e)
+                continue
+            self.protocol.datagram_received(self.view[:size], addr)
+        self.stats.publish()
+    
+    def sendto(self, data, addr=None):
+        try:
+            self.sock.sendto(data, addr)
+        except (BlockingIOError, InterruptedError):
+            self.stats.send_dropped += 1
+        except OSError as e:
+            self.protocol.error_received(e)
+    
+    def get_extra_info(self, name, default=None):
+        if name == 'socket':
+            return self.sock
+        if name == 'sockname':
+            return self.sock.getsockname()
+        return default
+    
+    def is_closing(self):
+        return self.closing
+    
+    def close(self):
+        if self.closing:
+            return
+        self.closing = True
+        self.loop.remove_reader(self.sock.fileno())
+        self.sock.close()
+        self.protocol.connection_lost(None)
+    
+    def abort(self):
+        self.close()
+
+def create_socket(host, port, reuse_port):
+    """Неблокирующий UDP сокет; с reuse_port порт делят несколько процессов"""
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
+    if reuse_port:
+        # Ядро распределяет датаграммы между сокетами по адресу отправителя
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
+    server_socket.bind((host, port))
+    server_socket.setblocking(False)
+    return server_socket
+
+def format_stats(name, stats, rate):
+    return (f"[{name}] пакетов: {stats.packets} ({rate:.0f}/с), байт: {stats.bytes}, "
+            f"не отправлено ответов: {stats.send_dropped}")
+
+async def report_stats(name, stats, interval):
+    """Периодически печатает счетчики воркера и скорость за последний интервал"""
+    previous = 0
+    while True:
+        await asyncio.sleep(interval)
+        print(format_stats(name, stats, (stats.packets - previous) / interval))
+        previous = stats.packets
+
+async def serve_async(args, stats, reuse_port):
+    loop = asyncio.get_running_loop()
+    name = f"воркер {stats.index}, pid {os.getpid()}"
+    transport = BatchedDatagramTransport(
+        loop, create_socket(args.host, args.port, reuse_port),
+        HelloProtocol(stats, RateLimitedLog(args.log_rate)), stats,
+    )
+    started = time.monotonic()
+    reporter = None
+    if args.stats_interval > 0:
+        reporter = asyncio.create_task(report_stats(name, stats, args.stats_interval))
+    try:
+        await asyncio.Future()
+    finally:
+        if reporter is not None:
+            reporter.cancel()
+        transport.close()
+        stats.publish()
+        # Итог: средняя скорость за все время работы
+        print(format_stats(name, stats, stats.packets / max(time.monotonic() - started, 1e-9)))
+
+def run_worker(args, slots=None, index=0, reuse_port=False):
+    """Тело воркера режима async"""
+    stats = WorkerStats(slots, index)
+    try:
+        asyncio.run(serve_async(args, stats, reuse_port))
+    except KeyboardInterrupt:
+        pass
+
+def spawn(target, *args):
+    """Запускает функцию в процессе-потомке через fork; возвращает pid"""
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            target(*args)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f"[!] Процесс {os.getpid()} упал: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def run_cluster(args):
+    """Супервизор: N воркеров на одном порту; упавшие перезапускаются"""
+    # Пакеты и байты каждого воркера; пишет только сам воркер, поэтому без блокировки
+    slots = multiprocessing.Array('q', 2 * args.workers, lock=False)
+    
+    print(f"Супервизор {os.getpid()}: воркеров: {args.workers}")
+    # pid -> (номер воркера, время запуска)
+    children = {}
+    for index in range(args.workers):
+        children[spawn(run_worker, args, slots, index, True)] = (index, time.monotonic())
+    
+    try:
+        while True:
+            pid, status = os.wait()
+            if pid not in children:
+                continue
+            index, started = children.pop(pid)
+            print(f"[!] Воркер {index} ({pid}) завершился "
+                  f"(код {os.waitstatus_to_exitcode(status)}), перезапуск")
+            
+            # Не перезапускаем в цикле процесс, который падает сразу при старте
+            if time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            children[spawn(run_worker, args, slots, index, True)] = (index, time.monotonic())
+    except KeyboardInterrupt:
+        # SIGINT получает вся группа процессов; ждем, пока воркеры допишут счетчики
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
     
-    # Настройки сервера
-    host = 'localhost'
-    port = 9999
+    print("\nСчетчики воркеров:")
+    for index in range(args.workers):
+        print(f"  воркер {index}: пакетов: {slots[2 * index]}, байт: {slots[2 * index + 1]}")
+    print(f"  всего: пакетов: {sum(slots[0::2])}, байт: {sum(slots[1::2])}")
+
+def serve_simple(host, port):
+    """Исходный режим: один recvfrom/sendto за итерацию и печать каждой датаграммы"""
+    # Создаем UDP сокет
+    server_socket = socket.socket(socket.AF_INET, socket.SOCK_DGRAM)
     
     # Привязываем сокет к адресу и порту
     server_socket.bind((host, port))
@@ -32,6 +283,34 @@ def main():
         server_socket.sendto(response.encode('utf-8'), client_address)
         print(f"Отправлено клиенту: {response}\n")
 
+def main():
+    parser = argparse.ArgumentParser(description="UDP сервер")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9999)
+    parser.add_argument('--mode', choices=('simple', 'async'), default='simple',
+                        help="simple - исходный цикл recvfrom/sendto, async - пакетное чтение на asyncio")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="режим async: число процессов на одном порту (SO_REUSEPORT)")
+    parser.add_argument('--log-rate', type=int, default=LOG_RATE,
+                        help="режим async: сколько строк журнала в секунду печатать")
+    parser.add_argument('--stats-interval', type=float, default=STATS_INTERVAL,
+                        help="режим async: как часто печатать счетчики (0 - только при остановке)")
+    args = parser.parse_args()
+    if args.workers < 1:
+        parser.error("--workers должен быть положительным")
+    if args.workers > 1 and args.mode != 'async':
+        parser.error("--workers работает только с --mode async")
+    
+    if args.mode == 'simple':
+        serve_simple(args.host, args.port)
+        return
+    
+    print(f"UDP сервер (режим async) запущен на {args.host}:{args.port}")
+    if args.workers > 1:
+        run_cluster(args)
+    else:
+        run_worker(args)
+
 if __name__ == "__main__":
     try:
         main()
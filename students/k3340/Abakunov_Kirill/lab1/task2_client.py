@@ -2,37 +2,222 @@
 """
 Задание 2: TCP клиент для математических операций
 Отправляет параметры для вычисления по теореме Пифагора
+
+С --bulk читает пары "a,b" из файла и отправляет их строками по
+--batch-size пар по одному соединению, не дожидаясь ответов; с --binary
+пары уходят двоичными кадрами float64, а с --expression значения
+подставляются в произвольное выражение. Неверная пара (или строка
+значений, на которой выражение не вычисляется) дает на своем месте
+строку INVALID_RESULT, так что вывод выровнен с входным файлом.
 """
 
+import argparse
+import array
+import collections
+import functools
 import socket
+import sys
+import threading
+import time
 
-def main():
-    # Создаем TCP сокет
-    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
-    # Настройки сервера
-    host = 'localhost'
-    port = 9998
-    
-    try:
-        # Подключаемся к серверу
-        client_socket.connect((host, port))
-        print(f"Подключено к серверу {host}:{port}")
-        
-        # Получаем входные данные от пользователя
-        print("\nТеорема Пифагора: c = √(a² + b²)")
-        a = input("Введите значение катета a: ")
-        b = input("Введите значение катета b: ")
+from task2_server import BINARY_HEADER, BINARY_MAGIC, INVALID_RESULT, MAX_BINARY_PAIRS, place_invalid
+
+# Пар в одной строке запроса в пакетном режиме
+BATCH_SIZE = 1000
+
+ERROR_PREFIX = "Ошибка".encode('utf-8')
+
+INVALID_TOKEN = INVALID_RESULT.encode('ascii')
+
+def interactive(client_socket):
+    """Спрашивает катеты, пока пользователь не введет пустую строку"""
+    replies = client_socket.makefile('rb')
+    print("\nТеорема Пифагора: c = √(a² + b²)")
+    while True:
+        a = input("Введите значение катета a (пусто - выход): ").strip()
+        if not a:
+            break
+        b = input("Введите значение катета b: ").strip()
         
         # Отправляем данные серверу
         message = f"{a},{b}"
-        client_socket.send(message.encode('utf-8'))
+        client_socket.sendall(f"{message}\n".encode('utf-8'))
         print(f"Отправлено серверу: {message}")
         
         # Получаем результат от сервера
-        response = client_socket.recv(1024).decode('utf-8')
-        print(f"\nОтвет от сервера: {response}")
-        
+        response = replies.readline().decode('utf-8').strip()
+        if not response:
+            print("Сервер закрыл соединение")
+            break
+        if response.startswith("Ошибка"):
+            print(f"\nОтвет от сервера: {response}\n")
+        elif response == INVALID_RESULT:
+            print("\nОтвет от сервера: катеты должны быть числами\n")
+        else:
+            print(f"\nОтвет от сервера: Теорема Пифагора: a={a}, b={b}, c={float(response):.4f}\n")
+
+def read_pairs(file):
+    """Пары "a,b" из файла: по одной или несколько в строке"""
+    for line in file:
+        yield from line.split()
+
+def encode_text(batch, totals, prefix=b''):
+    return prefix + b' '.join(batch) + b'\n'
+
+def encode_binary(batch, totals):
+    """Двоичный кадр из пар "a,b".
+
+    Неверные пары в кадр не попадают; их номера в пачке ставятся в очередь
+    totals['skipped'], чтобы читатель ответов вывел на их месте INVALID_RESULT.
+    """
+    values = array.array('d')
+    skipped = []
+    for number, pair in enumerate(batch):
+        a, separator, b = pair.partition(b',')
+        try:
+            if not separator:
+                raise ValueError(pair)
+            a, b = float(a), float(b)
+        except ValueError:
+            skipped.append(number)
+            continue
+        values.append(a)
+        values.append(b)
+    if sys.byteorder != 'little':
+        values.byteswap()
+    # Кадр еще не отправлен, поэтому номера окажутся в очереди раньше ответа на него
+    totals['skipped'].append(skipped)
+    return BINARY_HEADER.pack(BINARY_MAGIC, len(values) // 2) + values.tobytes()
+
+def send_batches(client_socket, file, batch_size, encode, totals):
+    """Поток отправки: склеивает пары в запросы по batch_size и закрывает запись"""
+    batch = []
+    try:
+        for pair in read_pairs(file):
+            batch.append(pair)
+            if len(batch) == batch_size:
+                client_socket.sendall(encode(batch, totals))
+                totals['sent'] += len(batch)
+                batch = []
+        if batch:
+            client_socket.sendall(encode(batch, totals))
+            totals['sent'] += len(batch)
+        # Сервер дочитает, ответит на все запросы и закроет соединение
+        client_socket.shutdown(socket.SHUT_WR)
+    except OSError as e:
+        totals['error'] = e
+
+def read_text_replies(replies, output, counters, skipped):
+    """Строки ответов: гипотенузы (или INVALID_RESULT) через пробел или сообщение об ошибке"""
+    for line in replies:
+        if line.startswith(ERROR_PREFIX):
+            counters['errors'] += 1
+            sys.stderr.write(line.decode('utf-8'))
+            continue
+        invalid = line.split().count(INVALID_TOKEN)
+        counters['invalid'] += invalid
+        counters['received'] += line.count(b' ') + 1 - invalid
+        output.write(line.replace(b' ', b'\n'))
+
+def read_binary_replies(replies, output, counters, skipped):
+    """Двоичные кадры ответов; текстовая строка означает ошибку протокола"""
+    while True:
+        header = replies.read(BINARY_HEADER.size)
+        if not header:
+            return
+        if not header.startswith(BINARY_MAGIC):
+            counters['errors'] += 1
+            sys.stderr.write((header + replies.readline()).decode('utf-8', 'replace'))
+            return
+        _, count = BINARY_HEADER.unpack(header)
+        results = array.array('d')
+        results.frombytes(replies.read(count * 8))
+        if sys.byteorder != 'little':
+            results.byteswap()
+        counters['received'] += len(results)
+        lines = list(map(repr, results))
+        invalid = skipped.popleft()
+        if invalid:
+            counters['invalid'] += len(invalid)
+            lines = place_invalid(lines, invalid)
+        if lines:
+            output.write(('\n'.join(lines) + '\n').encode('ascii'))
+
+def bulk(client_socket, path, output_path, batch_size, binary, prefix):
+    """Пакетный режим: результаты по одному в строке, сводка в stderr"""
+    # Номера неверных пар каждого отправленного двоичного кадра, по порядку
+    skipped = collections.deque()
+    totals = {'sent': 0, 'skipped': skipped, 'error': None}
+    counters = {'received': 0, 'invalid': 0, 'errors': 0}
+    output = open(output_path, 'wb') if output_path else sys.stdout.buffer
+    if binary:
+        encode, read_replies = encode_binary, read_binary_replies
+    else:
+        encode, read_replies = functools.partial(encode_text, prefix=prefix), read_text_replies
+    started = time.perf_counter()
+    
+    with open(path, 'rb') as file:
+        # Ответы читаются параллельно с отправкой, иначе при заполненных
+        # буферах сокета клиент и сервер ждали бы друг друга
+        sender = threading.Thread(target=send_batches,
+                                  args=(client_socket, file, batch_size, encode, totals))
+        sender.start()
+        try:
+            read_replies(client_socket.makefile('rb'), output, counters, skipped)
+        finally:
+            sender.join()
+            if output_path:
+                output.close()
+            else:
+                output.flush()
+    
+    elapsed = time.perf_counter() - started
+    if totals['error'] is not None:
+        print(f"Ошибка отправки: {totals['error']}", file=sys.stderr)
+    received = counters['received']
+    if counters['invalid']:
+        print(f"Неверных пар (в выводе {INVALID_RESULT}): {counters['invalid']}", file=sys.stderr)
+    print(f"Отправлено пар: {totals['sent']}, получено результатов: {received}, "
+          f"ответов с ошибкой: {counters['errors']}, время: {elapsed:.2f} с, "
+          f"{received / elapsed if elapsed else 0:.0f} пар/с", file=sys.stderr)
+
+def main():
+    parser = argparse.ArgumentParser(description="TCP клиент: теорема Пифагора")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9998)
+    parser.add_argument('--bulk', metavar='FILE',
+                        help="файл с парами a,b: отправить все и вывести результаты")
+    parser.add_argument('--output', metavar='FILE',
+                        help="куда записать результаты пакетного режима (по умолчанию stdout)")
+    parser.add_argument('--batch-size', type=int, default=BATCH_SIZE,
+                        help="пар в одном запросе в пакетном режиме")
+    parser.add_argument('--binary', action='store_true',
+                        help="пакетный режим: отправлять пары двоичными кадрами float64")
+    parser.add_argument('--expression',
+                        help="пакетный режим: выражение вместо теоремы Пифагора, например (a+b)/2*h")
+    parser.add_argument('--variables', default='a,b',
+                        help="имена переменных выражения через запятую, в порядке значений в файле")
+    args = parser.parse_args()
+    if args.batch_size < 1:
+        parser.error("--batch-size должен быть положительным")
+    if args.binary and args.batch_size > MAX_BINARY_PAIRS:
+        parser.error(f"в двоичном кадре не больше {MAX_BINARY_PAIRS} пар")
+    if args.binary and args.expression:
+        parser.error("--expression работает только с текстовыми запросами")
+    prefix = f"eval {args.expression}; {args.variables}; ".encode('utf-8') if args.expression else b''
+    
+    # Создаем TCP сокет
+    client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
+    
+    try:
+        # Подключаемся к серверу
+        client_socket.connect((args.host, args.port))
+        if args.bulk:
+            bulk(client_socket, args.bulk, args.output, args.batch_size, args.binary, prefix)
+        else:
+            print(f"Подключено к серверу {args.host}:{args.port}")
+            interactive(client_socket)
+    
     except ConnectionRefusedError:
         print("Ошибка: не удалось подключиться к серверу. Убедитесь, что сервер запущен.")
     except Exception as e:
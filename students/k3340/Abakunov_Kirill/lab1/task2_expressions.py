@@ -0,0 +1,115 @@
+#!/usr/bin/env python3
+"""
+Задание 2: Вычисление выражений
+Разбор арифметического выражения в безопасное AST и компиляция в функцию
+"""
+
+import ast
+import functools
+import keyword
+import math
+
+# Самое длинное выражение (символов)
+MAX_EXPRESSION_SIZE = 256
+
+# Сколько скомпилированных выражений хранить
+EXPRESSION_CACHE_SIZE = 256
+
+# Функции и константы, доступные в выражениях
+FUNCTIONS = {
+    name: getattr(math, name) for name in (
+        'sqrt', 'hypot', 'exp', 'log', 'log2', 'log10', 'pow', 'fabs', 'floor', 'ceil',
+        'sin', 'cos', 'tan', 'asin', 'acos', 'atan', 'atan2', 'sinh', 'cosh', 'tanh',
+        'degrees', 'radians',
+    )
+}
+FUNCTIONS.update(abs=abs, min=min, max=max)
+CONSTANTS = {'pi': math.pi, 'e': math.e, 'tau': math.tau}
+
+BINARY_OPERATORS = (ast.Add, ast.Sub, ast.Mult, ast.Div, ast.FloorDiv, ast.Mod, ast.Pow)
+UNARY_OPERATORS = (ast.UAdd, ast.USub)
+
+class ExpressionError(ValueError):
+    """Выражение нельзя вычислить: синтаксис или недопустимая конструкция"""
+
+class ExpressionChecker(ast.NodeTransformer):
+    """Пропускает только арифметику, переменные, константы и функции из FUNCTIONS.
+
+    Целые константы превращаются в float, так что 9**9**9 дает
+    OverflowError, а не многочасовое вычисление огромного целого.
+    """
+    
+    def __init__(self, variables):
+        self.variables = variables
+    
+    def generic_visit(self, node):
+        raise ExpressionError(f"недопустимая конструкция: {type(node).__name__}")
+    
+    def visit_Expression(self, node):
+        node.body = self.visit(node.body)
+        return node
+    
+    def visit_BinOp(self, node):
+        if not isinstance(node.op, BINARY_OPERATORS):
+            raise ExpressionError(f"недопустимая операция: {type(node.op).__name__}")
+        node.left = self.visit(node.left)
+        node.right = self.visit(node.right)
+        return node
+    
+    def visit_UnaryOp(self, node):
+        if not isinstance(node.op, UNARY_OPERATORS):
+            raise ExpressionError(f"недопустимая операция: {type(node.op).__name__}")
+        node.operand = self.visit(node.operand)
+        return node
+    
+    def visit_Constant(self, node):
+        if type(node.value) not in (int, float):
+            raise ExpressionError(f"недопустимая константа: {node.value!r}")
+        node.value = float(node.value)
+        return node
+    
+    def visit_Name(self, node):
+        if node.id not in self.variables and node.id not in CONSTANTS:
+            raise ExpressionError(f"неизвестное имя: {node.id}")
+        return node
+    
+    def visit_Call(self, node):
+        if not isinstance(node.func, ast.Name) or node.func.id not in FUNCTIONS:
+            raise ExpressionError("вызывать можно только функции: " + ", ".join(FUNCTIONS))
+        if node.keywords:
+            raise ExpressionError("именованные аргументы не поддерживаются")
+        node.args = [self.visit(argument) for argument in node.args]
+        return node
+
+def check_variables(variables):
+    """Имена переменных: идентификаторы без повторов, не совпадающие с функциями"""
+    for name in variables:
+        if not name.isidentifier() or keyword.iskeyword(name):
+            raise ExpressionError(f"неверное имя переменной: {name!r}")
+        if name in FUNCTIONS or name in CONSTANTS:
+            raise ExpressionError(f"имя {name} занято функцией или константой")
+    if len(set(variables)) != len(variables):
+        raise ExpressionError("переменные повторяются")
+
+@functools.lru_cache(maxsize=EXPRESSION_CACHE_SIZE)
+def compile_expression(expression, variables):
+    """Функция от variables (кортеж имен), вычисляющая expression.
+
+    Выражение разбирается и проверяется один раз; повторные запросы с тем
+    же выражением берут готовую функцию из LRU-кэша.
+    """
+    if len(expression) > MAX_EXPRESSION_SIZE:
+        raise ExpressionError(f"выражение длиннее {MAX_EXPRESSION_SIZE} символов")
+    check_variables(variables)
+    try:
+        tree = ast.parse(expression.strip(), mode='eval')
+    except SyntaxError as e:
+        raise ExpressionError(f"синтаксическая ошибка: {e.msg}") from None
+    tree = ExpressionChecker(variables).visit(tree)
+    
+    # lambda a, b: <выражение> - вызов функции дешевле, чем eval на каждую строку
+    arguments = ast.arguments(posonlyargs=[], args=[ast.arg(arg=name) for name in variables],
+                              kwonlyargs=[], kw_defaults=[], defaults=[])
+    function = ast.Expression(body=ast.Lambda(args=arguments, body=tree.body))
+    code = compile(ast.fix_missing_locations(function), '<expression>', 'eval')
+    return eval(code, {'__builtins__': {}, **FUNCTIONS, **CONSTANTS})
@@ -2,68 +2,377 @@
 """
 Задание 2: TCP сервер для математических операций
 Вариант: Теорема Пифагора (c = √(a² + b²))
+
+Соединение постоянное: клиент отправляет строки, в каждой одна или
+несколько пар "a,b" через пробел, и получает на каждую строку одну
+строку ответа с гипотенузами в том же порядке; на месте неверной пары
+стоит INVALID_RESULT, так что ответ остается выровнен с запросом. Вместо строки можно
+отправить двоичный кадр: заголовок BINARY_HEADER и пары (a, b) в виде
+float64 little-endian; ответ - такой же заголовок и гипотенузы float64.
+
+Строка "eval <выражение>; <переменные>; <значения>" вычисляет произвольное
+выражение, например "eval (a+b)/2*h; a,b,h; 3,5,2 1,1,1"; неверная
+строка значений, как и неверная пара, дает INVALID_RESULT на своем месте.
 """
 
-import socket
+import argparse
+import array
+import concurrent.futures
 import math
+import os
+import socket
+import struct
+import sys
+import threading
+
+from task2_expressions import ExpressionError, compile_expression
+
+try:
+    import numpy as np
+except ImportError:
+    np = None
+
+# Размер одного чтения из сокета
+RECV_BUFFER_SIZE = 64 * 1024
+
+# Самая длинная строка запроса (байт); длиннее - ошибка и закрытие соединения
+MAX_LINE_SIZE = 16 * 1024 * 1024
+
+LISTEN_BACKLOG = 128
+
+# Двоичный кадр: сигнатура (первый байт нулевой, строка так не начинается) и число пар
+BINARY_MAGIC = b'\x00HYP'
+BINARY_HEADER = struct.Struct('<4sI')
+PAIR_SIZE = 16
+MAX_BINARY_PAIRS = MAX_LINE_SIZE // PAIR_SIZE
+
+FORMAT_ERROR = "Ошибка: неверный формат данных. Ожидается: a,b [a,b ...]\n".encode('utf-8')
+
+# Результат на месте пары, которую не удалось разобрать
+INVALID_RESULT = 'error'
+
+EVAL_PREFIX = b'eval '
+
+# Процессов для больших запросов (0 - все считается в потоке соединения)
+PROCESSES = os.cpu_count() or 1
+
+# Строки запроса длиннее этого (байт) делятся между процессами пула
+PARALLEL_THRESHOLD = 256 * 1024
+
+class ProtocolError(Exception):
+    """Нарушение формата, после которого соединение закрывается"""
+
+# Печатать ли каждое соединение
+verbose = True
 
-def calculate_pythagorean(a, b):
-    """Вычисляет гипотенузу по теореме Пифагора"""
-    c = math.sqrt(a**2 + b**2)
-    return c
+# Пул процессов для больших запросов (None - без пула)
+process_pool = None
+pool_processes = 0
+parallel_threshold = PARALLEL_THRESHOLD
+
+def calculate_batch(a_values, b_values):
+    """Гипотенузы для всех пар одним проходом (NumPy, если установлен)"""
+    if np is not None:
+        return np.hypot(np.array(a_values, dtype=np.float64),
+                        np.array(b_values, dtype=np.float64)).tolist()
+    return list(map(math.hypot, a_values, b_values))
+
+def calculate_packed(payload):
+    """Гипотенузы для упакованных пар float64 LE; результат упакован так же.
+
+    Числа читаются прямо из буфера приема, без промежуточного списка:
+    np.frombuffer, а без NumPy - memoryview.cast.
+    """
+    if np is not None:
+        pairs = np.frombuffer(payload, dtype='<f8').reshape(-1, 2)
+        return np.hypot(pairs[:, 0], pairs[:, 1]).astype('<f8', copy=False).tobytes()
+    
+    if sys.byteorder == 'little':
+        values = payload.cast('d')
+    else:
+        values = array.array('d')
+        values.frombytes(payload)
+        values.byteswap()
+    results = array.array('d', map(math.hypot, values[0::2], values[1::2]))
+    if sys.byteorder != 'little':
+        results.byteswap()
+    return results.tobytes()
+
+def handle_packed(buffer, start, count):
+    """Ответ на двоичный кадр, пары которого лежат в buffer начиная со start"""
+    with memoryview(buffer) as view:
+        with view[start:start + count * PAIR_SIZE] as payload:
+            results = calculate_packed(payload)
+    return BINARY_HEADER.pack(BINARY_MAGIC, count) + results
+
+def parse_pairs(line):
+    """Разбирает строку "a,b a,b ..." в два списка катетов и номера неверных пар"""
+    a_values = []
+    b_values = []
+    invalid = []
+    for number, token in enumerate(line.split()):
+        a, separator, b = token.partition(b',')
+        try:
+            if not separator:
+                raise ValueError(token)
+            a, b = float(a), float(b)
+        except ValueError:
+            invalid.append(number)
+            continue
+        a_values.append(a)
+        b_values.append(b)
+    return a_values, b_values, invalid
+
+def place_invalid(results, invalid):
+    """Вставляет INVALID_RESULT на места неверных пар (номера по возрастанию)"""
+    merged = []
+    start = 0
+    for number in invalid:
+        # Перед неверной парой в ответе ровно number элементов
+        end = start + number - len(merged)
+        merged.extend(results[start:end])
+        merged.append(INVALID_RESULT)
+        start = end
+    merged.extend(results[start:])
+    return merged
+
+def parse_rows(rows, width):
+    """Разбирает "x,y,z x,y,z ..." в width столбцов чисел и номера неверных строк"""
+    columns = [[] for _ in range(width)]
+    invalid = []
+    for number, token in enumerate(rows.split()):
+        values = token.split(b',')
+        try:
+            if len(values) != width:
+                raise ValueError(token)
+            values = [float(value) for value in values]
+        except ValueError:
+            invalid.append(number)
+            continue
+        for column, value in zip(columns, values):
+            column.append(value)
+    return columns, invalid
+
+def evaluate_rows(function, columns):
+    """Значения функции по строкам; строка, на которой она падает, дает INVALID_RESULT"""
+    try:
+        return list(map(repr, map(float, map(function, *columns))))
+    except (ArithmeticError, ValueError, TypeError):
+        # Хотя бы одна строка вне области определения: считаем по одной
+        pass
+    results = []
+    for values in zip(*columns):
+        try:
+            results.append(repr(float(function(*values))))
+        except (ArithmeticError, ValueError, TypeError):
+            results.append(INVALID_RESULT)
+    return results
+
+def parse_eval(line):
+    """Разбирает "eval <выражение>; <переменные>; <значения>" """
+    try:
+        expression, variables, rows = line[len(EVAL_PREFIX):].split(b';', 2)
+    except ValueError:
+        raise ExpressionError("ожидается: eval <выражение>; <переменные>; <значения>") from None
+    variables = tuple(name.strip() for name in variables.decode('utf-8').split(',') if name.strip())
+    return expression.decode('utf-8'), variables, rows
+
+def compute_chunk(expression, variables, rows):
+    """Результаты для участка строки запроса, через пробел, и их число.
+
+    expression None - пары катетов. Функция выполняется и в процессах
+    пула, поэтому принимает только то, что можно передать между процессами.
+    """
+    if expression is None:
+        a_values, b_values, invalid = parse_pairs(rows)
+        results = calculate_batch(a_values, b_values)
+        if invalid:
+            tokens = place_invalid(list(map(repr, results)), invalid)
+            return " ".join(tokens).encode('ascii'), len(results)
+    else:
+        function = compile_expression(expression, variables)
+        if variables:
+            columns, invalid = parse_rows(rows, len(variables))
+            tokens = place_invalid(evaluate_rows(function, columns), invalid)
+            return " ".join(tokens).encode('ascii'), len(tokens) - tokens.count(INVALID_RESULT)
+        results = [float(function())]
+    # repr дает кратчайшую запись, по которой число восстанавливается точно
+    return " ".join(map(repr, results)).encode('ascii'), len(results)
+
+def split_rows(rows, parts):
+    """Делит строку значений на parts участков по границам между парами"""
+    chunks = []
+    step = len(rows) // parts + 1
+    start = 0
+    while start < len(rows):
+        end = rows.find(b' ', start + step)
+        if end < 0:
+            end = len(rows)
+        chunk = rows[start:end]
+        if chunk.strip():
+            chunks.append(chunk)
+        start = end + 1
+    return chunks
+
+def compute(expression, variables, rows):
+    """Небольшие запросы считаются сразу, большие делятся между процессами пула"""
+    if process_pool is None or len(rows) < parallel_threshold:
+        return compute_chunk(expression, variables, rows)
+    if expression is not None:
+        # Ошибка в выражении видна сразу, без обращения к пулу
+        compile_expression(expression, variables)
+    
+    futures = [process_pool.submit(compute_chunk, expression, variables, chunk)
+               for chunk in split_rows(bytes(rows), pool_processes)]
+    try:
+        parts = [future.result() for future in futures]
+    except concurrent.futures.process.BrokenProcessPool:
+        print("[!] Пул процессов недоступен, запрос считается в потоке соединения")
+        return compute_chunk(expression, variables, rows)
+    return b' '.join(reply for reply, _ in parts), sum(count for _, count in parts)
+
+def handle_line(line):
+    """Ответ на одну строку запроса (с переводом строки) и число результатов"""
+    if line.startswith(EVAL_PREFIX):
+        try:
+            expression, variables, rows = parse_eval(line)
+            if variables and not rows.strip():
+                raise ExpressionError("нет значений переменных")
+            reply, count = compute(expression, variables, rows)
+        except ExpressionError as e:
+            return f"Ошибка: {e}\n".encode('utf-8'), 0
+        except ValueError as e:
+            # Выход за область определения выражения без переменных
+            return f"Ошибка: {e}\n".encode('utf-8'), 0
+        except (ArithmeticError, TypeError) as e:
+            return f"Ошибка вычисления: {e}\n".encode('utf-8'), 0
+        return reply + b"\n", count
+    
+    try:
+        if not line.strip():
+            raise ValueError(line)
+        reply, count = compute(None, None, line)
+    except ValueError:
+        return FORMAT_ERROR, 0
+    return reply + b"\n", count
+
+def handle_client(client_socket, client_address):
+    """Обслуживает постоянное соединение, пока клиент его не закроет.
+
+    Все запросы, пришедшие одним чтением, обрабатываются подряд, и ответы
+    на них уходят одним sendall. Перевод строки ищется только в новых
+    данных; двоичный кадр ждет, пока не придет целиком.
+    """
+    if verbose:
+        print(f"Подключен клиент: {client_address}")
+    buffer = bytearray()
+    # До какого места в buffer уже искали перевод строки
+    scanned = 0
+    requests = 0
+    pairs = 0
+    
+    try:
+        while True:
+            data = client_socket.recv(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            buffer += data
+            
+            replies = []
+            pos = 0
+            while pos < len(buffer):
+                if buffer[pos] == BINARY_MAGIC[0]:
+                    if len(buffer) - pos < BINARY_HEADER.size:
+                        break
+                    magic, count = BINARY_HEADER.unpack_from(buffer, pos)
+                    if magic != BINARY_MAGIC:
+                        raise ProtocolError("неизвестный двоичный заголовок")
+                    if count > MAX_BINARY_PAIRS:
+                        raise ProtocolError(f"в кадре больше {MAX_BINARY_PAIRS} пар")
+                    start = pos + BINARY_HEADER.size
+                    end = start + count * PAIR_SIZE
+                    if len(buffer) < end:
+                        break
+                    reply = handle_packed(buffer, start, count)
+                    pos = end
+                else:
+                    newline = buffer.find(b'\n', max(pos, scanned))
+                    if newline < 0:
+                        scanned = len(buffer)
+                        if scanned - pos > MAX_LINE_SIZE:
+                            raise ProtocolError(f"строка длиннее {MAX_LINE_SIZE} байт")
+                        break
+                    reply, count = handle_line(buffer[pos:newline])
+                    pos = newline + 1
+                replies.append(reply)
+                requests += 1
+                pairs += count
+            
+            del buffer[:pos]
+            scanned = max(scanned - pos, 0)
+            if replies:
+                client_socket.sendall(b''.join(replies))
+    except ConnectionError:
+        pass
+    except ProtocolError as e:
+        print(f"Ошибка протокола от {client_address}: {e}")
+        try:
+            client_socket.sendall(f"Ошибка: {e}\n".encode('utf-8'))
+        except OSError:
+            pass
+    except Exception as e:
+        print(f"Ошибка при обработке {client_address}: {e}")
+    finally:
+        client_socket.close()
+        if verbose:
+            print(f"Соединение с {client_address} закрыто (запросов: {requests}, пар: {pairs})\n")
+
+def start_pool(processes):
+    """Запускает процессы пула сразу, до появления потоков соединений"""
+    global process_pool, pool_processes
+    
+    process_pool = concurrent.futures.ProcessPoolExecutor(max_workers=processes)
+    pool_processes = processes
+    process_pool.submit(int).result()
 
 def main():
+    global verbose, parallel_threshold
+    
+    parser = argparse.ArgumentParser(description="TCP сервер: теорема Пифагора")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9998)
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="не печатать подключения клиентов")
+    parser.add_argument('--processes', type=int, default=PROCESSES,
+                        help="процессов для больших запросов (0 - без пула)")
+    parser.add_argument('--parallel-threshold', type=int, default=PARALLEL_THRESHOLD,
+                        help="с какой длины строки запроса (байт) делить ее между процессами")
+    args = parser.parse_args()
+    verbose = not args.quiet
+    parallel_threshold = args.parallel_threshold
+    if args.processes > 0:
+        start_pool(args.processes)
+    
     # Создаем TCP сокет
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
-    
-    # Настройки сервера
-    host = 'localhost'
-    port = 9998
+    server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     
     # Привязываем сокет к адресу и порту
-    server_socket.bind((host, port))
+    server_socket.bind((args.host, args.port))
     
-    # Начинаем прослушивание (максимум 5 соединений в очереди)
-    server_socket.listen(5)
+    # Начинаем прослушивание
+    server_socket.listen(LISTEN_BACKLOG)
     
-    print(f"TCP сервер запущен на {host}:{port}")
+    print(f"TCP сервер запущен на {args.host}:{args.port}")
+    print(f"Вычисления: {'NumPy' if np is not None else 'math.hypot'}, "
+          f"процессов для больших запросов: {args.processes}")
     print("Ожидание подключений клиентов...\n")
     
     while True:
-        # Принимаем подключение
+        # Принимаем подключение; соединение постоянное, поэтому у каждого свой поток
         client_socket, client_address = server_socket.accept()
-        print(f"Подключен клиент: {client_address}")
-        
-        try:
-            # Получаем данные от клиента
-            data = client_socket.recv(1024).decode('utf-8')
-            print(f"Получено: {data}")
-            
-            # Парсим данные (ожидаем формат: "a,b")
-            a, b = map(float, data.split(','))
-            
-            # Вычисляем результат
-            c = calculate_pythagorean(a, b)
-            
-            # Формируем ответ
-            response = f"Теорема Пифагора: a={a}, b={b}, c={c:.4f}"
-            print(f"Результат: {response}")
-            
-            # Отправляем результат клиенту
-            client_socket.send(response.encode('utf-8'))
-            
-        except ValueError:
-            error_msg = "Ошибка: неверный формат данных. Ожидается: a,b"
-            client_socket.send(error_msg.encode('utf-8'))
-            print(error_msg)
-        except Exception as e:
-            error_msg = f"Ошибка: {str(e)}"
-            client_socket.send(error_msg.encode('utf-8'))
-            print(error_msg)
-        finally:
-            # Закрываем соединение с клиентом
-            client_socket.close()
-            print(f"Соединение с {client_address} закрыто\n")
+        threading.Thread(target=handle_client, args=(client_socket, client_address),
+                         daemon=True).start()
 
 if __name__ == "__main__":
     try:
@@ -4,10 +4,382 @@
 Отдает HTML-страницу из файла index.html
 """
 
+import argparse
+import collections
+import email.utils
+import html
+import mimetypes
 import socket
 import os
+import queue
+import threading
+import time
+import urllib.parse
+
+# Ограничения соединений по умолчанию (меняются флагами командной строки)
+READ_TIMEOUT = 10.0
+WRITE_TIMEOUT = 10.0
+LISTEN_BACKLOG = 128
+
+# Сколько файлов держать в кэше метаданных
+FILE_CACHE_SIZE = 1024
+
+# Пул потоков по умолчанию выключен (0 - запросы обрабатываются по очереди)
+WORKERS = 0
+QUEUE_SIZE = 64
+
+# Счетчики соединений
+connection_stats = {'accepted': 0, 'timed_out': 0, 'rejected': 0}
+stats_lock = threading.Lock()
+
+# Кэш метаданных файлов: путь -> FileEntry (в порядке последнего использования)
+file_cache = collections.OrderedDict()
+file_cache_lock = threading.Lock()
+
+BAD_REQUEST_RESPONSE = (b"HTTP/1.1 400 Bad Request\r\n"
+                        b"Content-Length: 0\r\n"
+                        b"Connection: close\r\n\r\n")
+
+# Ответ, когда очередь пула заполнена
+OVERLOAD_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                     b"Retry-After: 1\r\n"
+                     b"Content-Length: 0\r\n"
+                     b"Connection: close\r\n\r\n")
+
+class FileEntry:
+    """Метаданные файла и готовые заголовки, действительные пока не изменился mtime"""
+    
+    __slots__ = ('path', 'mtime_ns', 'size', 'etag', 'last_modified', 'mtime',
+                 'content_type', 'gzip')
+    
+    def __init__(self, path, stat, content_type, suffix=''):
+        self.path = path
+        self.mtime_ns = stat.st_mtime_ns
+        self.mtime = int(stat.st_mtime)
+        self.size = stat.st_size
+        self.etag = f'"{stat.st_ino:x}-{stat.st_mtime_ns:x}-{stat.st_size:x}{suffix}"'
+        self.last_modified = email.utils.formatdate(stat.st_mtime, usegmt=True)
+        self.content_type = content_type
+        # Предварительно сжатая копия рядом с файлом (file.gz) или None
+        self.gzip = None
+
+def count(name):
+    """Увеличивает счетчик соединений (из любого потока)"""
+    with stats_lock:
+        connection_stats[name] += 1
+
+def read_request(client_socket, read_timeout):
+    """Читает заголовки запроса, но не дольше read_timeout секунд"""
+    request = b''
+    deadline = time.monotonic() + read_timeout
+    while b'\r\n\r\n' not in request and len(request) < 8192:
+        client_socket.settimeout(max(deadline - time.monotonic(), 0.001))
+        data = client_socket.recv(1024)
+        if not data:
+            break
+        request += data
+    return request.decode('utf-8', errors='replace')
+
+def parse_request(request):
+    """Разбирает строку запроса и заголовки; возвращает (метод, путь, заголовки)"""
+    lines = request.split('\r\n')
+    first_line = lines[0].split()
+    if len(first_line) < 3:
+        return None, None, {}
+    
+    headers = {}
+    for line in lines[1:]:
+        if line == '':
+            break
+        if ':' in line:
+            key, value = line.split(':', 1)
+            headers[key.strip().lower()] = value.strip()
+    
+    return first_line[0], first_line[1], headers
+
+def resolve_path(root, url_path):
+    """Переводит путь из URL в путь к файлу внутри root (или None)"""
+    path = urllib.parse.unquote(url_path.split('?', 1)[0])
+    if '\x00' in path:
+        # os.path не принимает NUL; такой путь - ошибка клиента
+        raise ValueError("NUL в пути")
+    full_path = os.path.realpath(os.path.join(root, path.lstrip('/')))
+    # Не выпускаем запрос за пределы корня (../../etc/passwd)
+    if os.path.commonpath([root, full_path]) != root:
+        return None
+    if os.path.isdir(full_path):
+        full_path = os.path.join(full_path, 'index.html')
+    return full_path
+
+def not_found_body(name):
+    """Тело 404 с именем запрошенного файла"""
+    return ("<h1>404 - File Not Found</h1>"
+            f"<p>Файл {html.escape(name)} не найден</p>").encode('utf-8')
+
+def get_file_entry(path):
+    """Возвращает метаданные файла из кэша; один stat на запрос.
+
+    Запись пересоздается, только если у файла изменился mtime или размер.
+    """
+    try:
+        stat = os.stat(path)
+    except OSError:
+        with file_cache_lock:
+            file_cache.pop(path, None)
+        return None
+    
+    with file_cache_lock:
+        entry = file_cache.get(path)
+        if entry is not None and entry.mtime_ns == stat.st_mtime_ns and entry.size == stat.st_size:
+            file_cache.move_to_end(path)
+            return entry
+    
+    content_type = mimetypes.guess_type(path)[0] or 'application/octet-stream'
+    if content_type.startswith('text/'):
+        content_type += '; charset=utf-8'
+    entry = FileEntry(path, stat, content_type)
+    get_gzip_entry(entry)
+    
+    with file_cache_lock:
+        file_cache[path] = entry
+        file_cache.move_to_end(path)
+        if len(file_cache) > FILE_CACHE_SIZE:
+            file_cache.popitem(last=False)
+    return entry
+
+def get_gzip_entry(entry):
+    """Проверяет сжатую копию file.gz рядом с файлом и обновляет entry.gzip.
+
+    Копия используется, только если она не старше оригинала.
+    """
+    try:
+        gz_stat = os.stat(entry.path + '.gz')
+    except OSError:
+        gz_stat = None
+    
+    if gz_stat is None or gz_stat.st_mtime_ns < entry.mtime_ns:
+        entry.gzip = None
+    elif (entry.gzip is None or entry.gzip.mtime_ns != gz_stat.st_mtime_ns
+            or entry.gzip.size != gz_stat.st_size):
+        entry.gzip = FileEntry(entry.path + '.gz', gz_stat, entry.content_type, '-gz')
+    return entry.gzip
+
+def accepts_gzip(headers):
+    """Принимает ли клиент Content-Encoding: gzip"""
+    for item in headers.get('accept-encoding', '').split(','):
+        name, _, params = item.partition(';')
+        if name.strip().lower() == 'gzip':
+            return params.strip() not in ('q=0', 'q=0.0', 'q=0.00', 'q=0.000')
+    return False
+
+def is_not_modified(headers, entry):
+    """Проверяет If-None-Match / If-Modified-Since"""
+    if_none_match = headers.get('if-none-match')
+    if if_none_match is not None:
+        tags = [tag.strip().removeprefix('W/') for tag in if_none_match.split(',')]
+        return '*' in tags or entry.etag in tags
+    
+    if_modified_since = headers.get('if-modified-since')
+    if if_modified_since:
+        try:
+            since = email.utils.parsedate_to_datetime(if_modified_since)
+        except (TypeError, ValueError):
+            return False
+        return entry.mtime <= since.timestamp()
+    return False
+
+def parse_range(value, size):
+    """Разбирает Range: bytes=a-b, bytes=a-, bytes=-n.
+
+    Возвращает (start, end) включительно, None для запроса всего файла
+    (нет заголовка или несколько диапазонов) и False для недопустимого диапазона.
+    """
+    if not value or not value.startswith('bytes=') or ',' in value:
+        return None
+    start, _, end = value[6:].strip().partition('-')
+    try:
+        if start == '':
+            # Последние n байт
+            length = int(end)
+            if length <= 0:
+                return False
+            return max(size - length, 0), size - 1
+        start = int(start)
+        end = int(end) if end else size - 1
+    except ValueError:
+        return None
+    if start >= size or end < start:
+        return False
+    return start, min(end, size - 1)
+
+def send_file(client_socket, method, headers, entry):
+    """Отправляет файл (или его часть) через sendfile без копирования в память"""
+    representation = entry
+    encoding_header = ""
+    # Сжатая копия перепроверяется, только если клиент готов ее принять
+    if entry.gzip is not None and accepts_gzip(headers) and get_gzip_entry(entry) is not None:
+        representation = entry.gzip
+        encoding_header = "Content-Encoding: gzip\r\n"
+    
+    common = f"Content-Type: {entry.content_type}\r\n"
+    common += encoding_header
+    common += f"ETag: {representation.etag}\r\n"
+    common += f"Last-Modified: {representation.last_modified}\r\n"
+    common += "Accept-Ranges: bytes\r\n"
+    if entry.gzip is not None:
+        common += "Vary: Accept-Encoding\r\n"
+    common += "Connection: close\r\n"
+    
+    if is_not_modified(headers, representation):
+        client_socket.sendall(f"HTTP/1.1 304 Not Modified\r\n{common}\r\n".encode('utf-8'))
+        return 304
+    
+    size = representation.size
+    byte_range = parse_range(headers.get('range'), size)
+    # If-Range: диапазон отдается, только если у клиента та же версия файла
+    if byte_range and headers.get('if-range', representation.etag) != representation.etag:
+        byte_range = None
+    
+    if byte_range is False:
+        response = "HTTP/1.1 416 Range Not Satisfiable\r\n"
+        response += f"Content-Range: bytes */{size}\r\n"
+        response += "Content-Length: 0\r\n"
+        response += common
+        client_socket.sendall((response + "\r\n").encode('utf-8'))
+        return 416
+    
+    if byte_range is None:
+        status, offset, count = "200 OK", 0, size
+        response = f"HTTP/1.1 {status}\r\n"
+    else:
+        start, end = byte_range
+        status, offset, count = "206 Partial Content", start, end - start + 1
+        response = f"HTTP/1.1 {status}\r\n"
+        response += f"Content-Range: bytes {start}-{end}/{size}\r\n"
+    response += f"Content-Length: {count}\r\n"
+    response += common
+    response += "\r\n"
+    
+    client_socket.sendall(response.encode('utf-8'))
+    if method == 'GET' and count > 0:
+        with open(representation.path, 'rb') as file:
+            client_socket.sendfile(file, offset, count)
+    return int(status.split()[0])
+
+def handle_client(client_socket, client_address, args):
+    """Обрабатывает один запрос на соединении"""
+    try:
+        # Получаем HTTP-запрос; медленный клиент не держит сервер дольше read_timeout
+        request = read_request(client_socket, args.read_timeout)
+        print(f"Запрос:\n{request[:200]}...\n")
+        method, url_path, headers = parse_request(request)
+        
+        client_socket.settimeout(args.write_timeout)
+        if method not in ('GET', 'HEAD'):
+            client_socket.sendall(b"HTTP/1.1 405 Method Not Allowed\r\n"
+                                  b"Allow: GET, HEAD\r\nContent-Length: 0\r\n"
+                                  b"Connection: close\r\n\r\n")
+            return
+        
+        if args.root:
+            # Режим статических файлов: любой файл внутри корня
+            try:
+                file_path = resolve_path(args.root, url_path)
+            except ValueError:
+                client_socket.sendall(BAD_REQUEST_RESPONSE)
+                print(f"Ошибка: недопустимый путь {url_path!r}\n")
+                return
+            requested = urllib.parse.unquote(url_path.split('?', 1)[0])
+        else:
+            # Исходный режим: на любой путь отдается index.html
+            file_path = os.path.join(os.path.dirname(os.path.abspath(__file__)), 'index.html')
+            requested = 'index.html'
+        
+        entry = get_file_entry(file_path) if file_path else None
+        if entry is None:
+            # Если файл не найден, отправляем ошибку 404
+            body = not_found_body(requested)
+            response = "HTTP/1.1 404 Not Found\r\n"
+            response += "Content-Type: text/html; charset=utf-8\r\n"
+            response += f"Content-Length: {len(body)}\r\n"
+            response += "Connection: close\r\n"
+            response += "\r\n"
+            client_socket.sendall(response.encode('utf-8') + body)
+            print(f"Ошибка: файл для {url_path} не найден\n")
+            return
+        
+        status = send_file(client_socket, method, headers, entry)
+        print(f"{status} {url_path} отправлен клиенту\n")
+    
+    except TimeoutError:
+        count('timed_out')
+        print(f"Истекло время ожидания клиента {client_address}\n")
+    
+    except Exception as e:
+        print(f"Ошибка: {e}\n")
+    
+    finally:
+        # Закрываем соединение с клиентом
+        client_socket.close()
+
+def worker_loop(connections, args):
+    """Поток пула: берет принятые соединения из очереди и обслуживает их"""
+    while True:
+        client_socket, client_address = connections.get()
+        try:
+            handle_client(client_socket, client_address, args)
+        finally:
+            connections.task_done()
+
+def start_pool(args):
+    """Запускает args.workers потоков; возвращает ограниченную очередь соединений.
+
+    Память не растет с нагрузкой: в работе не больше workers соединений
+    и еще не больше queue_size ждут в очереди, остальным сразу отвечаем 503.
+    """
+    connections = queue.Queue(maxsize=args.queue_size)
+    for number in range(args.workers):
+        thread = threading.Thread(
+            target=worker_loop,
+            args=(connections, args),
+            name=f"http-worker-{number}",
+            daemon=True,
+        )
+        thread.start()
+    return connections
+
+def reject_overloaded(client_socket, client_address):
+    """Отвечает 503, не читая запрос, и закрывает соединение"""
+    count('rejected')
+    print(f"Очередь заполнена, отказ {client_address}\n")
+    try:
+        client_socket.settimeout(1.0)
+        client_socket.sendall(OVERLOAD_RESPONSE)
+    except OSError:
+        pass
+    finally:
+        client_socket.close()
 
 def main():
+    parser = argparse.ArgumentParser(description="HTTP сервер со статической страницей")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8080)
+    parser.add_argument('--root',
+                        help="корневой каталог для раздачи файлов (по умолчанию только index.html)")
+    parser.add_argument('--read-timeout', type=float, default=READ_TIMEOUT,
+                        help="секунд на получение запроса")
+    parser.add_argument('--write-timeout', type=float, default=WRITE_TIMEOUT,
+                        help="секунд на отправку ответа")
+    parser.add_argument('--backlog', type=int, default=LISTEN_BACKLOG,
+                        help="длина очереди listen()")
+    parser.add_argument('--workers', type=int, default=WORKERS,
+                        help="число потоков-обработчиков (0 - по одному запросу за раз)")
+    parser.add_argument('--queue-size', type=int, default=QUEUE_SIZE,
+                        help="сколько принятых соединений может ждать свободный поток")
+    args = parser.parse_args()
+    if args.root:
+        args.root = os.path.realpath(args.root)
+    
     # Создаем TCP сокет
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     
@@ -15,63 +387,50 @@ def main():
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     
     # Настройки сервера
-    host = 'localhost'
-    port = 8080
+    host = args.host
+    port = args.port
     
     # Привязываем сокет к адресу и порту
     server_socket.bind((host, port))
     
     # Начинаем прослушивание
-    server_socket.listen(5)
+    server_socket.listen(args.backlog)
     
     print(f"HTTP сервер запущен на http://{host}:{port}")
+    if args.root:
+        print(f"Корневой каталог: {args.root}")
     print("Откройте браузер и перейдите по указанному адресу")
     print("Для остановки нажмите Ctrl+C\n")
     
-    while True:
-        try:
-            # Принимаем подключение
-            client_socket, client_address = server_socket.accept()
-            print(f"Подключение от {client_address}")
-            
-            # Получаем HTTP-запрос
-            request = client_socket.recv(1024).decode('utf-8')
-            print(f"Запрос:\n{request[:200]}...\n")
-            
-            # Читаем HTML-файл
-            html_file_path = os.path.join(os.path.dirname(__file__), 'index.html')
-            
+    connections = None
+    if args.workers > 0:
+        connections = start_pool(args)
+        print(f"Пул: {args.workers} потоков, очередь {args.queue_size}\n")
+    
+    try:
+        while True:
             try:
-                with open(html_file_path, 'r', encoding='utf-8') as file:
-                    html_content = file.read()
-                
-                # Формируем HTTP-ответ
-                response = "HTTP/1.1 200 OK\r\n"
-                response += "Content-Type: text/html; charset=utf-8\r\n"
-                response += f"Content-Length: {len(html_content.encode('utf-8'))}\r\n"
-                response += "Connection: close\r\n"
-                response += "\r\n"
-                response += html_content
-                
-                # Отправляем ответ
-                client_socket.send(response.encode('utf-8'))
-                print("HTML-страница отправлена клиенту\n")
-                
-            except FileNotFoundError:
-                # Если файл не найден, отправляем ошибку 404
-                response = "HTTP/1.1 404 Not Found\r\n"
-                response += "Content-Type: text/html; charset=utf-8\r\n"
-                response += "\r\n"
-                response += "<h1>404 - File Not Found</h1>"
-                response += "<p>Файл index.html не найден</p>"
-                client_socket.send(response.encode('utf-8'))
-                print("Ошибка: файл index.html не найден\n")
+                # Принимаем подключение
+                client_socket, client_address = server_socket.accept()
+                count('accepted')
+                print(f"Подключение от {client_address}")
+            except Exception as e:
+                print(f"Ошибка: {e}\n")
+                continue
             
-            # Закрываем соединение с клиентом
-            client_socket.close()
+            if connections is None:
+                handle_client(client_socket, client_address, args)
+                continue
             
-        except Exception as e:
-            print(f"Ошибка: {e}\n")
+            # Передаем соединение пулу; если очередь полна - сразу 503
+            try:
+                connections.put_nowait((client_socket, client_address))
+            except queue.Full:
+                reject_overloaded(client_socket, client_address)
+    
+    finally:
+        server_socket.close()
+        print(f"Счетчики соединений: {connection_stats}")
 
 if __name__ == "__main__":
     try:
@@ -0,0 +1,321 @@
+#!/usr/bin/env python3
+"""
+Задание 4: Журнал сообщений чата на диске
+Сегменты ограниченного размера, разреженный индекс смещений и чтение через mmap
+"""
+
+import contextlib
+import mmap
+import os
+import struct
+import threading
+import time
+import zlib
+
+# Запись: crc32 остальной части, номер, время, длина комнаты, длина текста; затем комната и текст
+RECORD_HEADER = struct.Struct('<IQdHI')
+RECORD_FIELDS = struct.Struct('<QdHI')
+
+# Элемент индекса: номер записи и ее смещение в сегменте
+INDEX_ENTRY = struct.Struct('<QQ')
+
+# Каждая какая запись сегмента попадает в индекс
+INDEX_INTERVAL = 64
+
+# Наибольший размер сегмента (байт); запись, которая в него не помещается, начинает новый
+SEGMENT_SIZE = 4 * 1024 * 1024
+
+# Сколько сегментов хранить; более старые удаляются
+RETENTION_SEGMENTS = 16
+
+# Сколько байт журнала просматривать в поисках сообщений одной комнаты
+TAIL_SCAN_BYTES = 16 * 1024 * 1024
+
+# Как часто фоновый поток записывает накопленные сообщения (секунды)
+COMMIT_INTERVAL = 0.05
+
+def segment_name(first_seq):
+    return f"chat.{first_seq:016d}.log"
+
+def index_name(first_seq):
+    return f"chat.{first_seq:016d}.idx"
+
+def encode_record(seq, timestamp, room, text):
+    """Кодирует одну запись журнала"""
+    room_bytes = room.encode('utf-8')
+    text_bytes = text.encode('utf-8')
+    fields = RECORD_FIELDS.pack(seq, timestamp, len(room_bytes), len(text_bytes))
+    crc = zlib.crc32(text_bytes, zlib.crc32(room_bytes, zlib.crc32(fields)))
+    return struct.pack('<I', crc) + fields + room_bytes + text_bytes
+
+def decode_records(view, start, end):
+    """Записи из view[start:end] по порядку: (seq, время, комната, текст).
+
+    Останавливается на первой оборванной или поврежденной записи.
+    """
+    records = []
+    pos = start
+    while pos + RECORD_HEADER.size <= end:
+        crc, seq, timestamp, room_length, text_length = RECORD_HEADER.unpack_from(view, pos)
+        room_start = pos + RECORD_HEADER.size
+        text_start = room_start + room_length
+        record_end = text_start + text_length
+        if record_end > end or zlib.crc32(view[pos + 4:record_end]) != crc:
+            break
+        records.append((seq, timestamp, str(view[room_start:text_start], 'utf-8'),
+                        str(view[text_start:record_end], 'utf-8')))
+        pos = record_end
+    return records
+
+class Segment:
+    """Файл сегмента и его разреженный индекс (номер записи, смещение)"""
+    
+    __slots__ = ('first_seq', 'path', 'index_path', 'index', 'size')
+    
+    def __init__(self, directory, first_seq):
+        self.first_seq = first_seq
+        self.path = os.path.join(directory, segment_name(first_seq))
+        self.index_path = os.path.join(directory, index_name(first_seq))
+        self.index = [(first_seq, 0)]
+        self.size = 0
+    
+    def load_index(self):
+        """Читает индекс с диска; записи за пределами файла отбрасываются"""
+        self.size = os.path.getsize(self.path)
+        try:
+            with open(self.index_path, 'rb') as file:
+                data = file.read()
+        except FileNotFoundError:
+            return
+        usable = len(data) - len(data) % INDEX_ENTRY.size
+        for seq, offset in INDEX_ENTRY.iter_unpack(data[:usable]):
+            if 0 < offset < self.size:
+                self.index.append((seq, offset))
+
+class ChatLog:
+    """Журнал всех сообщений чата, разбитый на сегменты.
+
+    append() только ставит сообщение в очередь; фоновый поток раз в
+    COMMIT_INTERVAL записывает пачку одним write и одним fsync (на каждый
+    сегмент, если пачка не поместилась в один), поэтому журнал не тормозит
+    рассылку. Каждая INDEX_INTERVAL-я запись попадает в индекс сегмента,
+    и чтение последних сообщений отображает сегмент в память и разбирает
+    только участки между соседними точками индекса, начиная с конца, а не
+    весь журнал.
+    """
+    
+    def __init__(self, directory, segment_size=SEGMENT_SIZE,
+                 retention=RETENTION_SEGMENTS, commit_interval=COMMIT_INTERVAL):
+        self.directory = directory
+        self.segment_size = segment_size
+        self.retention = retention
+        self.commit_interval = commit_interval
+        os.makedirs(directory, exist_ok=True)
+        
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.pending = []
+        self.stopped = False
+        self.next_seq = 1
+        
+        self.segments = []
+        self.file = None
+        self.index_file = None
+        self.thread = None
+    
+    def open(self):
+        """Находит сегменты на диске и продолжает последний, пока в нем есть место"""
+        for name in sorted(os.listdir(self.directory)):
+            prefix, _, rest = name.partition('.')
+            number, _, suffix = rest.partition('.')
+            if prefix == 'chat' and suffix == 'log' and number.isdigit():
+                segment = Segment(self.directory, int(number))
+                segment.load_index()
+                self.segments.append(segment)
+        
+        if self.segments:
+            # Номер последней записи: разбираем только хвост после последней точки индекса
+            last = self.segments[-1]
+            seq, offset = last.index[-1]
+            with self._mapped(last) as view:
+                records = decode_records(view, offset, len(view)) if offset < len(view) else []
+            self.next_seq = records[-1][0] + 1 if records else seq
+            
+            # Оборванная при падении запись отрезается, иначе за ней не прочитать новые
+            end = offset + sum(len(encode_record(*record)) for record in records)
+            if end < last.size:
+                self._truncate(last, end)
+            if last.size < self.segment_size:
+                self._open_segment(last.first_seq)
+        
+        if self.file is None:
+            self._open_segment(self.next_seq)
+        self.thread = threading.Thread(target=self._run, name='chat-log', daemon=True)
+        self.thread.start()
+    
+    def append(self, room, text):
+        """Ставит сообщение в очередь на запись (не ждет диска)"""
+        with self.lock:
+            self.pending.append((self.next_seq, time.time(), room, text))
+            self.next_seq += 1
+    
+    def close(self):
+        """Записывает оставшиеся сообщения и останавливает поток"""
+        if self.thread is None:
+            return
+        with self.wakeup:
+            self.stopped = True
+            self.wakeup.notify()
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+        self.index_file.close()
+    
+    def tail(self, limit, room=None, max_bytes=TAIL_SCAN_BYTES):
+        """Последние limit сообщений (комнаты room или всех) в порядке отправки.
+
+        Сегменты просматриваются с конца; в каждом разбирается только
+        участок между двумя точками индекса, пока не набрано limit записей.
+        Редкие сообщения комнаты ищутся не дальше последних max_bytes байт
+        журнала - иначе запрос разбирал бы все хранимые сегменты.
+        """
+        result = []
+        if limit <= 0:
+            return result
+        with self.lock:
+            segments = [(segment, list(segment.index)) for segment in self.segments]
+        
+        for segment, index in reversed(segments):
+            with self._mapped(segment) as view:
+                end = len(view)
+                for _, offset in reversed(index):
+                    if offset >= end:
+                        continue
+                    records = decode_records(view, offset, end)
+                    max_bytes -= end - offset
+                    if room is not None:
+                        records = [record for record in records if record[2] == room]
+                    result.extend(reversed(records))
+                    if len(result) >= limit or max_bytes <= 0:
+                        del result[limit:]
+                        result.reverse()
+                        return result
+                    end = offset
+        result.reverse()
+        return result
+    
+    def _truncate(self, segment, size):
+        """Обрезает сегмент до size байт вместе с точками индекса за этой границей"""
+        os.truncate(segment.path, size)
+        segment.size = size
+        segment.index = [entry for entry in segment.index if entry[1] < size or entry[1] == 0]
+        with open(segment.index_path, 'wb') as file:
+            file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in segment.index[1:]))
+    
+    @contextlib.contextmanager
+    def _mapped(self, segment):
+        """Отображает сегмент в память; отдает memoryview (пустой, если читать нечего)"""
+        try:
+            file = open(segment.path, 'rb')
+        except FileNotFoundError:
+            # Сегмент удален политикой хранения, пока мы его читали
+            yield memoryview(b'')
+            return
+        with file:
+            if os.fstat(file.fileno()).st_size == 0:
+                yield memoryview(b'')
+                return
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    yield view
+                finally:
+                    view.release()
+    
+    def _run(self):
+        while True:
+            with self.wakeup:
+                if not self.stopped:
+                    self.wakeup.wait(self.commit_interval)
+                batch = self.pending
+                self.pending = []
+                stopped = self.stopped
+            
+            if batch:
+                self._commit(batch)
+            
+            if stopped:
+                return
+    
+    def _commit(self, batch):
+        """Записывает пачку: по одной записи и одному fsync на каждый затронутый сегмент"""
+        start = 0
+        while start < len(batch):
+            written = self._write_chunk(batch, start)
+            if written == start:
+                # Следующая запись не помещается в сегмент: новый начинается с нее
+                self._open_segment(batch[start][0])
+            start = written
+    
+    def _write_chunk(self, batch, start):
+        """Дописывает записи пачки с номера start, пока они помещаются в сегмент.
+
+        В пустой сегмент запись попадает всегда, даже если она больше
+        segment_size. Возвращает номер первой незаписанной записи.
+        """
+        segment = self.segments[-1]
+        parts = []
+        entries = []
+        offset = segment.size
+        end = start
+        while end < len(batch):
+            seq, timestamp, room, text = batch[end]
+            record = encode_record(seq, timestamp, room, text)
+            if offset > 0 and offset + len(record) > self.segment_size:
+                break
+            if (seq - segment.first_seq) % INDEX_INTERVAL == 0 and offset > 0:
+                entries.append((seq, offset))
+            parts.append(record)
+            offset += len(record)
+            end += 1
+        if not parts:
+            return end
+        
+        self.file.write(b''.join(parts))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+        segment.size = offset
+        
+        # Индекс ссылается только на уже записанные на диск данные
+        if entries:
+            self.index_file.write(b''.join(INDEX_ENTRY.pack(*entry) for entry in entries))
+            self.index_file.flush()
+            with self.lock:
+                segment.index.extend(entries)
+        return end
+    
+    def _open_segment(self, first_seq):
+        """Начинает сегмент с записи first_seq и удаляет сегменты сверх политики хранения"""
+        if self.file is not None:
+            self.file.close()
+            self.index_file.close()
+        
+        segment = Segment(self.directory, first_seq)
+        if self.segments and self.segments[-1].first_seq == first_seq:
+            # Последний сегмент пуст или в нем есть место: продолжаем писать в него
+            segment = self.segments.pop()
+        self.file = open(segment.path, 'ab')
+        self.index_file = open(segment.index_path, 'ab')
+        segment.size = self.file.tell()
+        
+        with self.lock:
+            self.segments.append(segment)
+            expired = self.segments[:-self.retention] if self.retention > 0 else []
+            del self.segments[:len(expired)]
+        
+        for old in expired:
+            for path in (old.path, old.index_path):
+                try:
+                    os.remove(path)
+                except FileNotFoundError:
+                    pass
@@ -1,25 +1,66 @@
 #!/usr/bin/env python3
 """
 Задание 4: Клиент для многопользовательского чата
-Подключается к серверу и обменивается сообщениями
+Подключается к серверу и обменивается сообщениями;
+с флагом --load работает как генератор нагрузки
 """
 
+import argparse
+import asyncio
+import json
+import os
 import socket
 import threading
 import sys
+import time
 
-def receive_messages(client_socket):
-    """Получает сообщения от сервера"""
+from task4_protocol import MAX_MESSAGE_SIZE, FrameDecoder, encode_frame
+
+# Размер одного чтения из сокета
+RECV_BUFFER_SIZE = 16 * 1024
+
+# Метка сообщений генератора нагрузки: "LOAD <отправитель> <номер> <время отправки, нс>"
+LOAD_MARKER = "LOAD"
+
+# Параметры нагрузки по умолчанию
+LOAD_RATE = 100.0
+LOAD_DURATION = 10.0
+LOAD_MESSAGE_SIZE = 64
+# Одновременных подключений меньше, чем очередь listen() сервера в режиме threads (10):
+# иначе часть ботов не дождется accept и не уложится в CONNECT_TIMEOUT
+CONNECT_CONCURRENCY = 8
+
+# Сколько ждать подключения и приветствия одного бота (секунды); дольше - ошибка подключения
+CONNECT_TIMEOUT = 10.0
+
+# Сколько ждать доставки последних сообщений после окончания отправки (секунды)
+DRAIN_TIME = 2.0
+
+# Запас сверх длительности теста, после которого зависшие боты останавливаются (секунды)
+FINISH_GRACE = 5.0
+
+def recv_messages(client_socket, decoder):
+    """Сообщения сервера по одному, пока соединение не закрыто"""
     while True:
-        try:
-            message = client_socket.recv(1024).decode('utf-8')
+        data = client_socket.recv(RECV_BUFFER_SIZE)
+        if not data:
+            return
+        yield from decoder.feed(data)
+
+def receive_messages(messages, client_socket, send_lock):
+    """Получает сообщения от сервера"""
+    try:
+        for message in messages:
             if not message:
-                break
+                # Heartbeat сервера: отвечаем пустым кадром
+                with send_lock:
+                    client_socket.sendall(encode_frame(''))
+                continue
             print(f"\r{message}\n>>> ", end='', flush=True)
-        except:
-            break
+    except:
+        pass
 
-def send_messages(client_socket):
+def send_messages(client_socket, send_lock):
     """Отправляет сообщения серверу"""
     while True:
         try:
@@ -27,21 +68,246 @@ def send_messages(client_socket):
             if message.lower() in ['exit', 'quit', 'выход']:
                 print("Отключение от чата...")
                 break
+            if len(message.encode('utf-8')) > MAX_MESSAGE_SIZE:
+                # Сервер закрыл бы соединение из-за такого кадра
+                print(f"Сообщение длиннее {MAX_MESSAGE_SIZE} байт, не отправлено")
+                continue
             if message.strip():
-                client_socket.send(message.encode('utf-8'))
+                # Кадры из двух потоков не должны перемешаться
+                with send_lock:
+                    client_socket.sendall(encode_frame(message))
         except KeyboardInterrupt:
             break
         except Exception as e:
             print(f"Ошибка отправки: {e}")
             break
 
+def percentiles(values):
+    """p50/p95/p99/max в миллисекундах (ближайший ранг)"""
+    if not values:
+        return None
+    ordered = sorted(values)
+    
+    def rank(p):
+        return ordered[min(len(ordered) - 1, max(0, int(len(ordered) * p / 100 + 0.5) - 1))]
+    
+    return {
+        'count': len(ordered),
+        'p50_ms': round(rank(50) / 1e6, 3),
+        'p95_ms': round(rank(95) / 1e6, 3),
+        'p99_ms': round(rank(99) / 1e6, 3),
+        'max_ms': round(ordered[-1] / 1e6, 3),
+    }
+
+class LoadStats:
+    """Измерения генератора нагрузки (время в наносекундах)"""
+    
+    def __init__(self):
+        self.connect_times = []
+        self.latencies = []
+        self.sent = 0
+        self.received = 0
+        self.failed_connections = 0
+        self.disconnects = 0
+
+async def load_reader(reader, writer, decoder, stats):
+    """Читает кадры бота и считает задержку доставки помеченных сообщений"""
+    while True:
+        data = await reader.read(RECV_BUFFER_SIZE)
+        if not data:
+            break
+        now = time.perf_counter_ns()
+        for message in decoder.feed(data):
+            if not message:
+                # Heartbeat сервера
+                writer.write(encode_frame(''))
+                continue
+            position = message.find(LOAD_MARKER + " ")
+            if position < 0:
+                continue
+            parts = message[position:].split(" ", 4)
+            try:
+                sent_at = int(parts[3])
+            except (IndexError, ValueError):
+                continue
+            stats.received += 1
+            stats.latencies.append(now - sent_at)
+
+async def read_until(reader, decoder, text):
+    """Читает кадры, пока не придет сообщение, содержащее text"""
+    while True:
+        data = await reader.read(RECV_BUFFER_SIZE)
+        if not data:
+            raise ConnectionError("сервер закрыл соединение")
+        if any(text in message for message in decoder.feed(data)):
+            return
+
+async def login(number, args, decoder):
+    """Подключает бота; подключение завершено, когда пришло приветствие после ввода имени"""
+    reader, writer = await asyncio.open_connection(args.host, args.port)
+    try:
+        await read_until(reader, decoder, "имя")
+        writer.write(encode_frame(f"bot{number}"))
+        await read_until(reader, decoder, "Добро пожаловать")
+    except BaseException:
+        # В том числе отмена по таймауту
+        writer.close()
+        raise
+    return reader, writer
+
+async def load_client(number, args, stats, connect_limit, started, stop_at):
+    """Один бот: подключается, представляется и шлет сообщения с заданной частотой"""
+    decoder = FrameDecoder()
+    async with connect_limit:
+        begin = time.perf_counter_ns()
+        try:
+            reader, writer = await asyncio.wait_for(login(number, args, decoder),
+                                                    args.connect_timeout)
+        except (OSError, ConnectionError, asyncio.TimeoutError):
+            stats.failed_connections += 1
+            return
+        stats.connect_times.append(time.perf_counter_ns() - begin)
+    
+    if args.room:
+        writer.write(encode_frame(f"/join {args.room}"))
+    
+    reader_task = asyncio.create_task(load_reader(reader, writer, decoder, stats))
+    await started.wait()
+    
+    # Каждый бот шлет rate / clients сообщений в секунду по абсолютному расписанию,
+    # со сдвигом старта, чтобы отправки не шли пачками
+    interval = args.clients / args.rate
+    next_send = time.perf_counter() + interval * number / args.clients
+    padding = "x" * max(args.message_size - 40, 0)
+    sequence = 0
+    try:
+        while True:
+            delay = next_send - time.perf_counter()
+            if delay > 0:
+                await asyncio.sleep(delay)
+            if time.perf_counter() >= stop_at[0] or reader_task.done():
+                break
+            writer.write(encode_frame(
+                f"{LOAD_MARKER} {number} {sequence} {time.perf_counter_ns()} {padding}"
+            ))
+            stats.sent += 1
+            sequence += 1
+            next_send += interval
+            await writer.drain()
+        
+        # Ждем доставки сообщений, отправленных последними
+        await asyncio.sleep(max(stop_at[0] + DRAIN_TIME - time.perf_counter(), 0))
+    except ConnectionError:
+        pass
+    finally:
+        if reader_task.done():
+            stats.disconnects += 1
+        reader_task.cancel()
+        writer.close()
+
+async def run_load(args):
+    """Генератор нагрузки: N ботов, измерение задержек и пропускной способности"""
+    stats = LoadStats()
+    connect_limit = asyncio.Semaphore(args.connect_concurrency)
+    started = asyncio.Event()
+    # Время окончания отправки; задается, когда все боты подключены
+    stop_at = [float('inf')]
+    
+    print(f"Подключение {args.clients} ботов к {args.host}:{args.port}...")
+    connect_begin = time.perf_counter()
+    tasks = [
+        asyncio.create_task(load_client(number, args, stats, connect_limit, started, stop_at))
+        for number in range(args.clients)
+    ]
+    while len(stats.connect_times) + stats.failed_connections < args.clients:
+        await asyncio.sleep(0.05)
+    connect_elapsed = time.perf_counter() - connect_begin
+    print(f"Подключено: {len(stats.connect_times)}, ошибок: {stats.failed_connections} "
+          f"за {connect_elapsed:.2f} с; нагрузка {args.rate} сообщ./с, {args.duration} с")
+    
+    # Лишние приветствия и уведомления о входе не попадают в измерения
+    await asyncio.sleep(0.5)
+    stats.latencies.clear()
+    stats.received = 0
+    
+    send_begin = time.perf_counter()
+    stop_at[0] = send_begin + args.duration
+    started.set()
+    # Бот, которого держит неотвечающий сервер, не должен держать весь тест
+    _, pending = await asyncio.wait(tasks, timeout=args.duration + DRAIN_TIME + FINISH_GRACE)
+    for task in pending:
+        task.cancel()
+    await asyncio.gather(*pending, return_exceptions=True)
+    
+    connected = len(stats.connect_times)
+    report = {
+        'clients': args.clients,
+        'connected': connected,
+        'failed_connections': stats.failed_connections,
+        'disconnected_during_test': stats.disconnects,
+        'stopped_by_deadline': len(pending),
+        'connect_seconds': round(connect_elapsed, 3),
+        'connect_latency': percentiles(stats.connect_times),
+        'duration_seconds': args.duration,
+        'target_rate': args.rate,
+        'sent': stats.sent,
+        'sent_per_second': round(stats.sent / args.duration, 1),
+        'delivered': stats.received,
+        'delivered_per_second': round(stats.received / args.duration, 1),
+        # Без комнат каждое сообщение должно дойти до всех остальных ботов
+        'expected_deliveries': stats.sent * max(connected - 1, 0),
+        'latency': percentiles(stats.latencies),
+    }
+    return report
+
+def main_load(args):
+    try:
+        report = asyncio.run(run_load(args))
+        text = json.dumps(report, ensure_ascii=False, indent=2)
+        if args.report:
+            with open(args.report, 'w', encoding='utf-8') as file:
+                file.write(text + "\n")
+            print(f"Отчет сохранен в {args.report}")
+        print(text, flush=True)
+    except BrokenPipeError:
+        # Вывод закрыт раньше времени (например, | head): молча завершаемся,
+        # перенаправив stdout, чтобы Python не упал на нем при выходе
+        os.dup2(os.open(os.devnull, os.O_WRONLY), sys.stdout.fileno())
+
 def main():
+    parser = argparse.ArgumentParser(description="Клиент многопользовательского чата")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9997)
+    parser.add_argument('--load', dest='clients', type=int,
+                        help="режим нагрузки: число ботов (без флага - интерактивный клиент)")
+    parser.add_argument('--rate', type=float, default=LOAD_RATE,
+                        help="сообщений в секунду от всех ботов вместе")
+    parser.add_argument('--duration', type=float, default=LOAD_DURATION,
+                        help="длительность отправки, секунд")
+    parser.add_argument('--message-size', type=int, default=LOAD_MESSAGE_SIZE,
+                        help="примерный размер сообщения в байтах")
+    parser.add_argument('--room', help="комната, в которую входят боты")
+    parser.add_argument('--connect-concurrency', type=int, default=CONNECT_CONCURRENCY,
+                        help="сколько подключений устанавливать одновременно")
+    parser.add_argument('--connect-timeout', type=float, default=CONNECT_TIMEOUT,
+                        help="сколько секунд ждать подключения и приветствия одного бота")
+    parser.add_argument('--report', help="файл для JSON-отчета")
+    args = parser.parse_args()
+    
+    if args.clients is not None:
+        for name in ('clients', 'rate', 'duration', 'connect_concurrency', 'connect_timeout'):
+            if getattr(args, name) <= 0:
+                option = '--load' if name == 'clients' else '--' + name.replace('_', '-')
+                parser.error(f"{option} должен быть положительным")
+        main_load(args)
+        return
+    
     # Создаем TCP сокет
     client_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     
     # Настройки сервера
-    host = 'localhost'
-    port = 9997
+    host = args.host
+    port = args.port
     
     try:
         # Подключаемся к серверу
@@ -50,26 +316,31 @@ def main():
         print("Успешное подключение!")
         print("-" * 50)
         
+        # Сообщения приходят кадрами; декодер собирает их из кусков любой длины
+        messages = recv_messages(client_socket, FrameDecoder())
+        
         # Получаем приглашение ввести имя
-        prompt = client_socket.recv(1024).decode('utf-8')
+        prompt = next(messages, '')
         username = input(prompt)
-        client_socket.send(username.encode('utf-8'))
+        client_socket.sendall(encode_frame(username))
         
         # Получаем приветственное сообщение
-        welcome = client_socket.recv(1024).decode('utf-8')
+        welcome = next(messages, '')
         print(welcome)
         print("-" * 50)
         print("Команды: 'exit', 'quit', 'выход' - выйти из чата")
         print("-" * 50)
         
         # Создаем поток для получения сообщений
-        receive_thread = threading.Thread(target=receive_messages, args=(client_socket,))
+        send_lock = threading.Lock()
+        receive_thread = threading.Thread(target=receive_messages,
+                                          args=(messages, client_socket, send_lock))
         receive_thread.daemon = True
         receive_thread.start()
         
         # Основной поток для отправки сообщений
-        send_messages(client_socket)
-        
+        send_messages(client_socket, send_lock)
+    
     except ConnectionRefusedError:
         print("Ошибка: не удалось подключиться к серверу.")
         print("Убедитесь, что сервер запущен.")
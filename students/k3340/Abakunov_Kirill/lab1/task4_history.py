@@ -0,0 +1,78 @@
+#!/usr/bin/env python3
+"""
+Задание 4: История последних сообщений комнат
+Кольцевой буфер готовых кадров с ограничением по числу сообщений и по байтам
+"""
+
+import collections
+import itertools
+import threading
+
+# Ограничения истории одной комнаты по умолчанию
+HISTORY_SIZE = 50
+HISTORY_BYTES = 64 * 1024
+
+# Для скольких комнат хранить историю (самые давно активные вытесняются)
+MAX_HISTORY_ROOMS = 1024
+
+class RoomHistory:
+    """Последние сообщения одной комнаты в виде закодированных кадров.
+
+    Добавление - append в deque и вытеснение самых старых кадров,
+    пока не соблюдены оба ограничения; кадры не перекодируются.
+    """
+    
+    __slots__ = ('frames', 'size', 'max_messages', 'max_bytes')
+    
+    def __init__(self, max_messages, max_bytes):
+        self.frames = collections.deque()
+        self.size = 0
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+    
+    def append(self, frame):
+        self.frames.append(frame)
+        self.size += len(frame)
+        while self.frames and (len(self.frames) > self.max_messages or self.size > self.max_bytes):
+            self.size -= len(self.frames.popleft())
+
+class HistoryStore:
+    """Истории всех комнат; общий объем ограничен max_rooms * max_bytes"""
+    
+    def __init__(self, max_messages=HISTORY_SIZE, max_bytes=HISTORY_BYTES,
+                 max_rooms=MAX_HISTORY_ROOMS):
+        self.max_messages = max_messages
+        self.max_bytes = max_bytes
+        self.max_rooms = max_rooms
+        # Комната -> RoomHistory в порядке последней активности
+        self.rooms = collections.OrderedDict()
+        self.lock = threading.Lock()
+    
+    @property
+    def enabled(self):
+        return self.max_messages > 0 and self.max_bytes > 0
+    
+    def append(self, room, frame):
+        """Запоминает кадр, уже отправленный участникам комнаты"""
+        if not self.enabled:
+            return
+        with self.lock:
+            history = self.rooms.get(room)
+            if history is None:
+                history = self.rooms[room] = RoomHistory(self.max_messages, self.max_bytes)
+                if len(self.rooms) > self.max_rooms:
+                    self.rooms.popitem(last=False)
+            else:
+                self.rooms.move_to_end(room)
+            history.append(frame)
+    
+    def replay(self, room, limit=None):
+        """Кадры истории комнаты (последние limit, если задан), склеенные для одной записи; (число, байты)"""
+        with self.lock:
+            history = self.rooms.get(room)
+            if history is None:
+                return 0, b''
+            frames = history.frames
+            if limit is not None and limit < len(frames):
+                frames = list(itertools.islice(frames, len(frames) - limit, None))
+            return len(frames), b''.join(frames)
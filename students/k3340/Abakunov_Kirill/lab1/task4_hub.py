@@ -0,0 +1,169 @@
+#!/usr/bin/env python3
+"""
+Задание 4: Связь между процессами чата
+Концентратор на Unix-сокете пересылает события каждого процесса всем остальным
+"""
+
+import asyncio
+import socket
+import threading
+import time
+
+from task4_outbox import AsyncOutbox, ThreadOutbox
+from task4_protocol import MAX_FRAME_SIZE, FrameDecoder, encode_frame, send_frames
+
+# Сколько событий может ждать отправки одному процессу
+HUB_QUEUE_SIZE = 10000
+
+# Пауза перед повторным подключением к концентратору (секунды)
+RECONNECT_DELAY = 0.5
+
+# Размер одного чтения из сокета
+RECV_BUFFER_SIZE = 64 * 1024
+
+# Процессы, подключенные к концентратору: поток записи -> очередь
+peers = {}
+
+async def relay_peer(reader, writer):
+    """Принимает кадры одного процесса и раскладывает их по очередям остальных.
+
+    Кадры пересылаются как есть, без декодирования текста.
+    """
+    outbox = AsyncOutbox(HUB_QUEUE_SIZE, 'disconnect')
+    peers[writer] = outbox
+    writer_task = asyncio.create_task(write_peer(writer, outbox))
+    decoder = FrameDecoder(MAX_FRAME_SIZE, raw=True)
+    
+    try:
+        while True:
+            data = await reader.read(RECV_BUFFER_SIZE)
+            if not data:
+                break
+            for frame in decoder.feed(data):
+                for peer, peer_outbox in list(peers.items()):
+                    if peer is not writer and not peer_outbox.put(frame):
+                        # Процесс не успевает читать: отключаем, он переподключится
+                        print("[!] Концентратор: процесс не успевает читать, отключаем")
+                        peer_outbox.close()
+                        peer.transport.abort()
+    except (ConnectionError, asyncio.CancelledError):
+        pass
+    except Exception as e:
+        print(f"[!] Концентратор: ошибка соединения: {e}")
+    finally:
+        peers.pop(writer, None)
+        outbox.close()
+        writer_task.cancel()
+        writer.close()
+
+async def write_peer(writer, outbox):
+    """Отправляет процессу накопленные кадры одним writelines"""
+    try:
+        while True:
+            batch = await outbox.take()
+            if batch is None:
+                break
+            writer.writelines(batch)
+            await writer.drain()
+    except ConnectionError:
+        writer.transport.abort()
+
+async def serve_hub(path):
+    server = await asyncio.start_unix_server(relay_peer, path)
+    async with server:
+        await server.serve_forever()
+
+def run_hub(path):
+    """Тело процесса-концентратора"""
+    try:
+        asyncio.run(serve_hub(path))
+    except KeyboardInterrupt:
+        pass
+
+class HubClient:
+    """Подключение процесса чата к концентратору.
+
+    publish() только кладет событие в ограниченную очередь, отправляет
+    его отдельный поток; другой поток читает события остальных процессов
+    и передает их в on_event. При обрыве соединение восстанавливается,
+    а события, накопленные за это время, досылаются.
+    """
+    
+    def __init__(self, path, on_event):
+        self.path = path
+        self.on_event = on_event
+        self.outbox = ThreadOutbox(HUB_QUEUE_SIZE, 'drop-oldest')
+        self.sock = None
+        self.connected = threading.Condition()
+        self.stopped = False
+    
+    def start(self):
+        threading.Thread(target=self._read_loop, name='hub-reader', daemon=True).start()
+        threading.Thread(target=self._write_loop, name='hub-writer', daemon=True).start()
+    
+    def publish(self, text):
+        """Ставит событие в очередь на отправку (не ждет сеть)"""
+        self.outbox.put(encode_frame(text))
+    
+    def close(self):
+        self.stopped = True
+        self.outbox.close()
+        with self.connected:
+            if self.sock is not None:
+                self.sock.close()
+            self.connected.notify_all()
+    
+    def _connect(self):
+        while not self.stopped:
+            sock = socket.socket(socket.AF_UNIX, socket.SOCK_STREAM)
+            try:
+                sock.connect(self.path)
+                return sock
+            except OSError:
+                sock.close()
+                time.sleep(RECONNECT_DELAY)
+        return None
+    
+    def _read_loop(self):
+        while not self.stopped:
+            sock = self._connect()
+            if sock is None:
+                return
+            with self.connected:
+                self.sock = sock
+                self.connected.notify_all()
+            
+            decoder = FrameDecoder(MAX_FRAME_SIZE)
+            try:
+                while True:
+                    data = sock.recv(RECV_BUFFER_SIZE)
+                    if not data:
+                        break
+                    for event in decoder.feed(data):
+                        self.on_event(event)
+            except OSError:
+                pass
+            
+            with self.connected:
+                self.sock = None
+            sock.close()
+            if not self.stopped:
+                print("[!] Связь с концентратором потеряна, переподключение")
+                time.sleep(RECONNECT_DELAY)
+    
+    def _write_loop(self):
+        while True:
+            batch = self.outbox.take()
+            if batch is None:
+                return
+            with self.connected:
+                while self.sock is None and not self.stopped:
+                    self.connected.wait()
+                sock = self.sock
+            if sock is None:
+                return
+            try:
+                send_frames(sock, batch)
+            except OSError:
+                # Пачка теряется; читатель заметит обрыв и переподключится
+                pass
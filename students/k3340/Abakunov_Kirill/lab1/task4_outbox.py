@@ -0,0 +1,105 @@
+#!/usr/bin/env python3
+"""
+Задание 4: Очереди исходящих сообщений чата
+Своя ограниченная очередь у каждого клиента, чтобы медленный читатель не тормозил остальных
+"""
+
+import asyncio
+import collections
+import threading
+
+# Что делать, когда очередь клиента заполнена
+OVERFLOW_POLICIES = ('drop-oldest', 'drop-newest', 'disconnect')
+
+class Outbox:
+    """Ограниченная очередь исходящих сообщений одного клиента.
+
+    put() только кладет сообщение в очередь и никогда не ждет сеть;
+    отправкой занимается отдельный писатель клиента, забирающий
+    все накопленное через take(). При переполнении действует политика:
+    drop-oldest выбрасывает самое старое сообщение, drop-newest - новое,
+    disconnect сообщает, что клиента пора отключить.
+    """
+    
+    def __init__(self, limit, policy='drop-oldest'):
+        if policy not in OVERFLOW_POLICIES:
+            raise ValueError(f"Неизвестная политика переполнения: {policy}")
+        self.messages = collections.deque()
+        self.limit = limit
+        self.policy = policy
+        self.closed = False
+        self.dropped = 0
+    
+    def __len__(self):
+        return len(self.messages)
+    
+    def _push(self, data):
+        """Кладет сообщение с учетом политики; False - клиента надо отключить"""
+        if self.closed:
+            return True
+        if len(self.messages) >= self.limit:
+            if self.policy == 'disconnect':
+                return False
+            self.dropped += 1
+            if self.policy == 'drop-newest':
+                return True
+            self.messages.popleft()
+        self.messages.append(data)
+        return True
+    
+    def _pop_all(self):
+        batch = list(self.messages)
+        self.messages.clear()
+        return batch
+
+class ThreadOutbox(Outbox):
+    """Очередь для режима threads: писатель ждет в отдельном потоке"""
+    
+    def __init__(self, limit, policy='drop-oldest'):
+        super().__init__(limit, policy)
+        self.ready = threading.Condition()
+    
+    def put(self, data):
+        with self.ready:
+            accepted = self._push(data)
+            self.ready.notify()
+        return accepted
+    
+    def take(self):
+        """Ждет сообщений; возвращает их списком или None после close()"""
+        with self.ready:
+            while not self.messages and not self.closed:
+                self.ready.wait()
+            if self.messages:
+                return self._pop_all()
+            return None
+    
+    def close(self):
+        with self.ready:
+            self.closed = True
+            self.ready.notify()
+
+class AsyncOutbox(Outbox):
+    """Очередь для режима async: писатель - задача на том же цикле событий"""
+    
+    def __init__(self, limit, policy='drop-oldest'):
+        super().__init__(limit, policy)
+        self.ready = asyncio.Event()
+    
+    def put(self, data):
+        accepted = self._push(data)
+        self.ready.set()
+        return accepted
+    
+    async def take(self):
+        """Ждет сообщений; возвращает их списком или None после close()"""
+        while not self.messages and not self.closed:
+            self.ready.clear()
+            await self.ready.wait()
+        if self.messages:
+            return self._pop_all()
+        return None
+    
+    def close(self):
+        self.closed = True
+        self.ready.set()
@@ -0,0 +1,173 @@
+#!/usr/bin/env python3
+"""
+Задание 4: Кто в сети
+Реестр пользователей по имени и колесо таймеров для отключения неактивных соединений
+"""
+
+import bisect
+import hashlib
+import math
+import os
+import threading
+import time
+
+# Пользователей на одной странице /who
+WHO_PAGE_SIZE = 20
+
+class NameClaims:
+    """Имена, занятые во всем кластере: по файлу на имя в общем каталоге.
+
+    Файл создается с O_CREAT | O_EXCL, поэтому из двух процессов, занимающих
+    одно имя одновременно, его получает только один. Файл называется по
+    sha256 имени (имя может быть длиннее NAME_MAX и содержать '/'), а внутри
+    лежит pid владельца, чтобы супервизор освободил имена упавшего воркера.
+    """
+    
+    def __init__(self, directory):
+        self.directory = directory
+    
+    def _path(self, name):
+        return os.path.join(self.directory, hashlib.sha256(name.encode('utf-8')).hexdigest())
+    
+    def claim(self, name):
+        """Занимает имя; False, если оно уже занято в каком-либо процессе"""
+        try:
+            fd = os.open(self._path(name), os.O_WRONLY | os.O_CREAT | os.O_EXCL, 0o600)
+        except FileExistsError:
+            return False
+        with os.fdopen(fd, 'w') as file:
+            file.write(str(os.getpid()))
+        return True
+    
+    def release(self, name):
+        try:
+            os.remove(self._path(name))
+        except FileNotFoundError:
+            pass
+    
+    def exists(self, name):
+        return os.path.exists(self._path(name))
+    
+    def release_owner(self, pid):
+        """Освобождает все имена процесса pid (вызывает супервизор, когда воркер упал)"""
+        for entry in os.scandir(self.directory):
+            try:
+                with open(entry.path) as file:
+                    owner = file.read()
+            except FileNotFoundError:
+                continue
+            if owner == str(pid):
+                try:
+                    os.remove(entry.path)
+                except FileNotFoundError:
+                    pass
+
+class PresenceRegistry:
+    """Пользователи процесса: имя -> клиент и имена по алфавиту.
+
+    Поиск адресата /msg - одно обращение к словарю; отсортированный
+    список поддерживается через bisect, так что страница /who
+    выбирается срезом без сортировки всех имен. С claims (режим
+    --workers) имя должно быть свободно и в остальных процессах.
+    """
+    
+    def __init__(self, claims=None):
+        self.by_name = {}
+        self.names = []
+        self.claims = claims
+        self.lock = threading.Lock()
+    
+    def add(self, username, client):
+        """Регистрирует клиента; при занятом имени добавляет номер. Возвращает итоговое имя"""
+        with self.lock:
+            name = username
+            suffix = 2
+            while name in self.by_name or (self.claims is not None and not self.claims.claim(name)):
+                name = f"{username}#{suffix}"
+                suffix += 1
+            self.by_name[name] = client
+            bisect.insort(self.names, name)
+            return name
+    
+    def remove(self, username, client):
+        with self.lock:
+            if self.by_name.get(username) is not client:
+                return
+            del self.by_name[username]
+            position = bisect.bisect_left(self.names, username)
+            del self.names[position]
+            if self.claims is not None:
+                self.claims.release(username)
+    
+    def online_elsewhere(self, username):
+        """Занято ли имя в другом процессе кластера"""
+        return self.claims is not None and username not in self.by_name and self.claims.exists(username)
+    
+    def get(self, username):
+        return self.by_name.get(username)
+    
+    def page(self, number, size=WHO_PAGE_SIZE):
+        """Возвращает (всего, число страниц, имена на странице number)"""
+        with self.lock:
+            total = len(self.names)
+            pages = max(math.ceil(total / size), 1)
+            start = (number - 1) * size
+            return total, pages, self.names[start:start + size]
+
+class TimerWheel:
+    """Хешированное колесо таймеров.
+
+    Таймер попадает в ячейку (текущая + число тиков) % size и хранит число
+    оставшихся оборотов, поэтому постановка и отмена стоят O(1), а каждый
+    тик просматривает только одну ячейку, сколько бы таймеров ни было.
+    """
+    
+    def __init__(self, tick=1.0, size=512):
+        self.tick = tick
+        self.size = size
+        self.slots = [{} for _ in range(size)]
+        # Ключ -> номер ячейки, чтобы отменять таймер без поиска
+        self.where = {}
+        self.current = 0
+        self.time = time.monotonic()
+        self.lock = threading.Lock()
+    
+    def __len__(self):
+        return len(self.where)
+    
+    def schedule(self, key, delay):
+        """Ставит (или переставляет) таймер key через delay секунд"""
+        ticks = max(1, math.ceil(delay / self.tick))
+        with self.lock:
+            self._cancel(key)
+            index = (self.current + ticks) % self.size
+            self.slots[index][key] = (ticks - 1) // self.size
+            self.where[key] = index
+    
+    def cancel(self, key):
+        with self.lock:
+            self._cancel(key)
+    
+    def _cancel(self, key):
+        index = self.where.pop(key, None)
+        if index is not None:
+            del self.slots[index][key]
+    
+    def advance(self, now=None):
+        """Проворачивает колесо до момента now; возвращает ключи сработавших таймеров"""
+        if now is None:
+            now = time.monotonic()
+        fired = []
+        with self.lock:
+            while now - self.time >= self.tick:
+                self.time += self.tick
+                self.current = (self.current + 1) % self.size
+                slot = self.slots[self.current]
+                for key, rounds in list(slot.items()):
+                    if rounds:
+                        slot[key] = rounds - 1
+                    else:
+                        del slot[key]
+                        del self.where[key]
+                        fired.append(key)
+        return fired
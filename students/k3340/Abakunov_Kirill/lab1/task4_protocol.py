@@ -0,0 +1,88 @@
+#!/usr/bin/env python3
+"""
+Задание 4: Протокол обмена сообщениями чата
+Каждое сообщение - кадр: длина (4 байта, big-endian) и текст в UTF-8
+"""
+
+import socket
+import struct
+
+# Заголовок кадра: длина текста в байтах
+FRAME_HEADER = struct.Struct('!I')
+
+# Самый длинный кадр, который примет FrameDecoder по умолчанию
+MAX_FRAME_SIZE = 64 * 1024
+
+# Самое длинное сообщение от клиента чата (байт UTF-8); длиннее - сервер закроет соединение
+MAX_MESSAGE_SIZE = 4096
+
+# Сколько буферов передавать в один sendmsg
+try:
+    IOV_MAX = min(socket.sysconf('SC_IOV_MAX'), 1024)
+except (AttributeError, ValueError, OSError):
+    IOV_MAX = 16
+
+class ProtocolError(Exception):
+    """Собеседник нарушил формат кадров"""
+
+def encode_frame(text):
+    """Кодирует одно сообщение в кадр"""
+    payload = text.encode('utf-8')
+    return FRAME_HEADER.pack(len(payload)) + payload
+
+class FrameDecoder:
+    """Собирает кадры из кусков, как бы ни резал их recv().
+
+    Текст декодируется только когда кадр пришел целиком, поэтому
+    символ, разрезанный границей чтения, больше не ломает декодирование.
+    С raw=True возвращаются сами кадры (с заголовком) без декодирования -
+    так их можно переслать дальше как есть.
+    """
+    
+    def __init__(self, max_frame_size=MAX_FRAME_SIZE, raw=False):
+        self.buffer = bytearray()
+        self.max_frame_size = max_frame_size
+        self.raw = raw
+    
+    def feed(self, data):
+        """Добавляет прочитанные байты; возвращает список готовых сообщений"""
+        self.buffer += data
+        messages = []
+        view = memoryview(self.buffer)
+        pos = 0
+        try:
+            while len(self.buffer) - pos >= FRAME_HEADER.size:
+                (length,) = FRAME_HEADER.unpack_from(view, pos)
+                if length > self.max_frame_size:
+                    raise ProtocolError(f"Кадр длиной {length} байт превышает лимит")
+                end = pos + FRAME_HEADER.size + length
+                if end > len(self.buffer):
+                    break
+                if self.raw:
+                    messages.append(bytes(view[pos:end]))
+                else:
+                    messages.append(str(view[pos + FRAME_HEADER.size:end], 'utf-8', 'replace'))
+                pos = end
+        finally:
+            view.release()
+        
+        # Разобранные кадры убираем из буфера одним сдвигом
+        if pos:
+            del self.buffer[:pos]
+        return messages
+
+def send_frames(sock, frames):
+    """Отправляет несколько кадров через sendmsg без склеивания в один буфер.
+
+    sendmsg может отправить только часть; остаток досылается тем же способом.
+    """
+    buffers = [memoryview(frame) for frame in frames]
+    first = 0
+    while first < len(buffers):
+        sent = sock.sendmsg(buffers[first:first + IOV_MAX])
+        # Пропускаем полностью отправленные буферы, первый неотправленный обрезаем
+        while sent and sent >= len(buffers[first]):
+            sent -= len(buffers[first])
+            first += 1
+        if sent:
+            buffers[first] = buffers[first][sent:]
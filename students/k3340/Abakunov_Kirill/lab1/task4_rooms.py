@@ -0,0 +1,83 @@
+#!/usr/bin/env python3
+"""
+Задание 4: Комнаты чата
+Прямой индекс комната -> участники и обратный участник -> комнаты
+"""
+
+import threading
+
+# Комната, в которую попадает каждый новый клиент
+DEFAULT_ROOM = 'general'
+
+# Самое длинное название комнаты
+MAX_ROOM_NAME = 32
+
+def valid_room_name(room):
+    """Название без пробелов и не длиннее MAX_ROOM_NAME"""
+    return 0 < len(room) <= MAX_ROOM_NAME and room.isprintable() and not any(
+        char.isspace() for char in room
+    )
+
+class RoomIndex:
+    """Подписки клиентов на комнаты.
+
+    members хранит множество участников каждой комнаты, поэтому сообщение
+    рассылается за O(размер комнаты), а не за O(все клиенты). Обратный
+    индекс rooms_of позволяет при отключении клиента убрать его из всех
+    комнат, не просматривая остальные. Пустые комнаты удаляются.
+    """
+    
+    def __init__(self):
+        self.members = {}
+        self.rooms_of = {}
+        self.lock = threading.Lock()
+    
+    def join(self, client, room):
+        """Подписывает клиента на комнату; False, если он уже в ней"""
+        with self.lock:
+            rooms = self.rooms_of.setdefault(client, set())
+            if room in rooms:
+                return False
+            rooms.add(room)
+            self.members.setdefault(room, set()).add(client)
+            return True
+    
+    def leave(self, client, room):
+        """Отписывает клиента от комнаты; False, если он в ней не был"""
+        with self.lock:
+            rooms = self.rooms_of.get(client)
+            if not rooms or room not in rooms:
+                return False
+            rooms.discard(room)
+            self._discard_member(room, client)
+            return True
+    
+    def remove_client(self, client):
+        """Убирает клиента из всех комнат; возвращает их список"""
+        with self.lock:
+            rooms = self.rooms_of.pop(client, set())
+            for room in rooms:
+                self._discard_member(room, client)
+            return sorted(rooms)
+    
+    def _discard_member(self, room, client):
+        members = self.members.get(room)
+        if members is not None:
+            members.discard(client)
+            if not members:
+                del self.members[room]
+    
+    def recipients(self, room):
+        """Копия списка участников комнаты (рассылка идет уже без блокировки)"""
+        with self.lock:
+            return list(self.members.get(room, ()))
+    
+    def rooms(self, client):
+        """Комнаты клиента по алфавиту"""
+        with self.lock:
+            return sorted(self.rooms_of.get(client, ()))
+    
+    def listing(self):
+        """Пары (комната, число участников) по алфавиту"""
+        with self.lock:
+            return sorted((room, len(members)) for room, members in self.members.items())
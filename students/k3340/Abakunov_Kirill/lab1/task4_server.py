@@ -1,107 +1,698 @@
 #!/usr/bin/env python3
 """
-Задание 4: Многопользовательский чат (TCP с потоками)
+Задание 4: Многопользовательский чат (TCP с потоками или asyncio)
 Сервер поддерживает множество клиентов одновременно
 """
 
+import argparse
+import asyncio
+import json
+import multiprocessing
+import os
+import resource
+import shutil
+import signal
 import socket
+import tempfile
 import threading
+import time
 
-# Список подключенных клиентов
-clients = []
+from task4_chat_log import RETENTION_SEGMENTS, SEGMENT_SIZE, ChatLog
+from task4_hub import HubClient, run_hub
+from task4_history import HISTORY_BYTES, HISTORY_SIZE, HistoryStore
+from task4_presence import NameClaims, PresenceRegistry, TimerWheel
+from task4_outbox import OVERFLOW_POLICIES, AsyncOutbox, ThreadOutbox
+from task4_protocol import MAX_MESSAGE_SIZE, FrameDecoder, ProtocolError, encode_frame, send_frames
+from task4_rooms import DEFAULT_ROOM, RoomIndex, valid_room_name
+
+# Подключенные клиенты: соединение (сокет или поток записи) -> ChatClient.
+# Словарь общий для обоих режимов; удаление за O(1)
+clients = {}
 clients_lock = threading.Lock()
 
-def broadcast(message, sender_socket=None):
-    """Отправляет сообщение всем подключенным клиентам, кроме отправителя"""
+# Подписки клиентов на комнаты
+room_index = RoomIndex()
+
+# Кто в сети: имя -> клиент (поиск адресата /msg и постраничный /who)
+presence = PresenceRegistry()
+
+# Колесо таймеров проверки активности: один таймер на клиента
+timer_wheel = TimerWheel()
+
+# Heartbeat: пустой кадр, на который клиент отвечает пустым кадром.
+# Клиента, от которого ничего не приходило idle_timeout секунд, отключаем
+HEARTBEAT_FRAME = encode_frame('')
+HEARTBEAT_INTERVAL = 15.0
+IDLE_TIMEOUT = 45.0
+heartbeat_interval = HEARTBEAT_INTERVAL
+idle_timeout = IDLE_TIMEOUT
+
+# Последние сообщения комнат для новых участников (пересоздается по флагам)
+room_history = HistoryStore()
+
+# Журнал сообщений на диске (включается флагом --log-dir)
+chat_log = None
+
+# Сколько последних записей журнала загружать в историю комнат при запуске
+RESTORE_RECORDS = 10000
+
+# Сколько сообщений можно запросить командой /history
+MAX_HISTORY_REQUEST = 500
+
+# Режим нескольких процессов (--workers): связь с концентратором,
+# счетчики онлайна по воркерам в разделяемой памяти и номер своего счетчика
+hub = None
+online_slots = None
+worker_slot = 0
+
+# Цикл событий режима async: события от концентратора передаются в него
+event_loop = None
+
+# Пауза перед перезапуском воркера, упавшего сразу после старта (секунды)
+RESPAWN_DELAY = 1.0
+
+# Очередь listen() по умолчанию: небольшая для потоков, максимальная для async,
+# где тысячи клиентов подключаются почти одновременно
+LISTEN_BACKLOG = 10
+ASYNC_LISTEN_BACKLOG = socket.SOMAXCONN
+
+# Размер одного чтения из сокета
+RECV_BUFFER_SIZE = 16 * 1024
+
+# Очередь исходящих сообщений клиента по умолчанию (меняется флагами)
+OUTBOX_SIZE = 256
+OVERFLOW_POLICY = 'drop-oldest'
+outbox_size = OUTBOX_SIZE
+overflow_policy = OVERFLOW_POLICY
+
+# Сколько секунд ждать, пока клиент примет ответ, в режиме threads
+WRITE_TIMEOUT = 10.0
+
+# Счетчики сообщений, выброшенных из переполненных очередей, и отключенных медленных клиентов
+chat_stats = {'dropped': 0, 'slow_disconnected': 0, 'idle_disconnected': 0}
+stats_lock = threading.Lock()
+
+# Печатать ли каждое сообщение (флаг -q отключает)
+verbose = True
+
+class ChatClient:
+    """Подключенный пользователь: имя, очередь исходящих и способ оборвать соединение"""
+    
+    __slots__ = ('username', 'outbox', 'abort', 'room', 'last_seen')
+    
+    def __init__(self, username, outbox, abort):
+        self.username = username
+        self.outbox = outbox
+        # Функция, разрывающая соединение (будит читателя клиента)
+        self.abort = abort
+        # Текущая комната: в нее уходят сообщения клиента (None - ни в одной)
+        self.room = DEFAULT_ROOM
+        # Когда от клиента последний раз что-то приходило (time.monotonic)
+        self.last_seen = time.monotonic()
+    
+    def send(self, data):
+        """Ставит данные в очередь клиента; медленного клиента отключает по политике"""
+        dropped = self.outbox.dropped
+        if self.outbox.put(data):
+            if self.outbox.dropped != dropped:
+                count('dropped')
+            return
+        
+        count('slow_disconnected')
+        log(f"[!] {self.username} не успевает читать, соединение закрыто")
+        self.outbox.close()
+        self.abort()
+
+def log(message):
+    """Печатает сообщение, если не включен тихий режим"""
+    if verbose:
+        print(message)
+
+def count(name):
+    """Увеличивает счетчик (из любого потока)"""
+    with stats_lock:
+        chat_stats[name] += 1
+
+def fan_out(room, message, sender=None):
+    """Отправляет сообщение участникам комнаты в этом процессе, кроме отправителя.
+
+    Под блокировкой индекса только копируется список участников комнаты;
+    сообщение раскладывается по их очередям уже без нее и без ожидания сети.
+    Возвращает закодированный кадр.
+    """
+    # Кадр кодируется один раз и общий для всех очередей
+    data = encode_frame(message)
+    for client in room_index.recipients(room):
+        if client is not sender:
+            client.send(data)
+    return data
+
+def fan_out_rooms(rooms, message):
+    """Отправляет уведомление участникам нескольких комнат в этом процессе.
+
+    Кто состоит в нескольких из них, получает его один раз.
+    """
+    recipients = set()
+    for room in rooms:
+        recipients.update(room_index.recipients(room))
+    data = encode_frame(message)
+    for client in recipients:
+        client.send(data)
+
+def broadcast_rooms(rooms, message):
+    """Уведомление нескольким комнатам во всех процессах одним событием"""
+    fan_out_rooms(rooms, message)
+    if hub is not None and rooms:
+        hub.publish(json.dumps({'rooms': rooms, 'text': message}))
+
+def broadcast(room, message, sender=None, record=False):
+    """Отправляет сообщение комнате во всех процессах.
+
+    record=True - сообщение пользователя: попадает в историю и журнал.
+    """
+    frame = fan_out(room, message, sender)
+    if record:
+        room_history.append(room, frame)
+        if chat_log is not None:
+            chat_log.append(room, message)
+    if hub is not None:
+        hub.publish(json.dumps({'room': room, 'text': message, 'record': record}))
+
+def deliver_relayed(event):
+    """Событие из другого процесса: рассылка только своим клиентам"""
+    event = json.loads(event)
+    if 'to' in event:
+        # Личное сообщение: доставляем, только если адресат подключен к этому процессу
+        target = presence.get(event['to'])
+        if target is not None:
+            target.send(encode_frame(event['text']))
+        return
+    if 'rooms' in event:
+        fan_out_rooms(event['rooms'], event['text'])
+        return
+    frame = fan_out(event['room'], event['text'])
+    if event['record']:
+        room_history.append(event['room'], frame)
+
+def on_hub_event(event):
+    """Вызывается в потоке связи с концентратором"""
+    if event_loop is not None:
+        event_loop.call_soon_threadsafe(deliver_relayed, event)
+    else:
+        deliver_relayed(event)
+
+def change_online(delta):
+    """Меняет счетчик онлайна; возвращает число пользователей во всех процессах"""
+    if online_slots is None:
+        with clients_lock:
+            return len(clients)
+    with online_slots.get_lock():
+        online_slots[worker_slot] += delta
+        return sum(online_slots)
+
+def reply(client, text):
+    """Ответ сервера одному клиенту"""
+    client.send(encode_frame(f"\n[Сервер] {text}\n"))
+
+def protocol_error_frame(error):
+    """Последний кадр клиенту, нарушившему протокол: почему закрыто соединение"""
+    return encode_frame(f"\n[Сервер] Ошибка: {error}, соединение закрыто\n")
+
+def format_stats():
+    """Метрики очередей для команды /stats"""
     with clients_lock:
-        for client in clients:
-            if client != sender_socket:
-                try:
-                    client.send(message.encode('utf-8'))
-                except:
-                    # Если не удалось отправить, удаляем клиента
-                    if client in clients:
-                        clients.remove(client)
+        depths = [len(client.outbox) for client in clients.values()]
+    with stats_lock:
+        stats = dict(chat_stats)
+    return (f"Клиентов: {len(depths)} (онлайн всего: {change_online(0)}), в очередях: {sum(depths)}, "
+            f"макс. очередь: {max(depths, default=0)}/{outbox_size}, "
+            f"выброшено: {stats['dropped']}, отключено медленных: {stats['slow_disconnected']}, "
+            f"неактивных: {stats['idle_disconnected']}")
+
+def history_replay(room):
+    """Кадры истории комнаты с заголовком, одним буфером (или b'')"""
+    count, frames = room_history.replay(room)
+    if not count:
+        return b''
+    return encode_frame(f"\n[Сервер] Последние сообщения в {room} ({count}):") + frames
+
+def register(connection, client):
+    """Добавляет клиента в комнату по умолчанию и уведомляет ее участников"""
+    requested = client.username
+    client.username = presence.add(requested, client)
+    with clients_lock:
+        clients[connection] = client
+    online = change_online(1)
+    room_index.join(client, DEFAULT_ROOM)
+    timer_wheel.schedule(client, heartbeat_interval)
+    
+    # Уведомляем комнату о новом пользователе
+    join_message = f"\n[Сервер] {client.username} присоединился к чату!"
+    log(join_message)
+    broadcast(DEFAULT_ROOM, join_message, client)
+    
+    # Приветствуем нового пользователя
+    welcome_message = (f"\nДобро пожаловать в чат, {client.username}!\n"
+                       f"Всего пользователей онлайн: {online}\n"
+                       f"Вы в комнате {DEFAULT_ROOM}. Команды: /join <комната>, /leave, /rooms, "
+                       f"/history [n], /msg <имя> <текст>, /who [страница]\n")
+    if client.username != requested:
+        welcome_message += f"Имя {requested} занято, вы вошли как {client.username}\n"
+    # Приветствие и история уходят клиенту одной записью
+    client.send(encode_frame(welcome_message) + history_replay(DEFAULT_ROOM))
+
+def unregister(connection):
+    """Удаляет клиента и уведомляет его комнаты об отключении"""
+    with clients_lock:
+        client = clients.pop(connection, None)
+    if client is None:
+        return
+    client.outbox.close()
+    change_online(-1)
+    presence.remove(client.username, client)
+    timer_wheel.cancel(client)
+    
+    leave_message = f"\n[Сервер] {client.username} покинул чат."
+    log(leave_message)
+    broadcast_rooms(room_index.remove_client(client), leave_message)
+
+def command_join(client, room):
+    """/join <комната>: подписывается на комнату и делает ее текущей"""
+    if not valid_room_name(room):
+        reply(client, "Использование: /join <комната> (без пробелов)")
+        return
+    joined = room_index.join(client, room)
+    if joined:
+        broadcast(room, f"\n[Сервер] {client.username} вошел в комнату {room}", client)
+    client.room = room
+    reply(client, f"Текущая комната: {room}")
+    if joined:
+        replay = history_replay(room)
+        if replay:
+            client.send(replay)
+
+def command_leave(client, room):
+    """/leave [комната]: выходит из комнаты (по умолчанию из текущей)"""
+    room = room or client.room
+    if room is None or not room_index.leave(client, room):
+        reply(client, f"Вы не в комнате {room}" if room else "Вы не в комнате")
+        return
+    broadcast(room, f"\n[Сервер] {client.username} вышел из комнаты {room}", client)
+    
+    # Текущей становится любая оставшаяся комната
+    if client.room == room:
+        remaining = room_index.rooms(client)
+        client.room = remaining[0] if remaining else None
+    if client.room is None:
+        reply(client, f"Вы вышли из {room} и не состоите ни в одной комнате; /join <комната>")
+    else:
+        reply(client, f"Вы вышли из {room}. Текущая комната: {client.room}")
+
+def command_rooms(client, argument):
+    """/rooms: список комнат с числом участников; * - ваши, > - текущая"""
+    joined = set(room_index.rooms(client))
+    lines = []
+    for room, size in room_index.listing():
+        mark = '>' if room == client.room else '*' if room in joined else ' '
+        lines.append(f" {mark} {room} ({size})")
+    reply(client, "Комнаты:\n" + "\n".join(lines) if lines else "Комнат нет")
+
+def command_history(client, argument):
+    """/history [n]: последние n сообщений текущей комнаты"""
+    room = client.room
+    if room is None:
+        reply(client, "Вы не в комнате; /join <комната>")
+        return
+    try:
+        limit = min(max(int(argument or HISTORY_SIZE), 1), MAX_HISTORY_REQUEST)
+    except ValueError:
+        reply(client, "Использование: /history [число сообщений]")
+        return
+    
+    if chat_log is None:
+        # Без журнала доступна только история в памяти
+        count, frames = room_history.replay(room, limit)
+        header = encode_frame(f"\n[Сервер] История {room} в памяти ({count}):")
+        client.send(header + frames)
+        return
+    
+    if event_loop is None:
+        send_history(client, room, chat_log.tail(limit, room))
+        return
+    # Режим async: журнал читается в пуле потоков, цикл событий не ждет диска
+    future = event_loop.run_in_executor(None, chat_log.tail, limit, room)
+    future.add_done_callback(lambda done: history_read(client, room, done))
+
+def history_read(client, room, future):
+    """Режим async: чтение журнала для /history закончилось (вызывается в цикле событий)"""
+    try:
+        records = future.result()
+    except Exception as e:
+        reply(client, f"Не удалось прочитать журнал: {e}")
+        return
+    send_history(client, room, records)
+
+def send_history(client, room, records):
+    """Отправляет клиенту записи журнала комнаты"""
+    frames = [encode_frame(f"\n[Сервер] История {room} ({len(records)}):")]
+    for _, timestamp, _, text in records:
+        frames.append(encode_frame(f"{time.strftime('%d.%m %H:%M', time.localtime(timestamp))} {text}"))
+    # Весь ответ уходит клиенту одной записью
+    client.send(b''.join(frames))
+
+def command_msg(client, argument):
+    """/msg <имя> <текст>: личное сообщение"""
+    username, _, text = argument.partition(' ')
+    text = text.strip()
+    if not username or not text:
+        reply(client, "Использование: /msg <имя> <текст>")
+        return
+    
+    message = f"[ЛС от {client.username}] {text}"
+    target = presence.get(username)
+    if target is not None:
+        target.send(encode_frame(message))
+    elif presence.online_elsewhere(username):
+        # Имя занято в другом процессе кластера (имена уникальны во всем кластере):
+        # событие получат все процессы, но доставит его только владелец имени
+        hub.publish(json.dumps({'to': username, 'text': message}))
+    else:
+        reply(client, f"Пользователь {username} не в сети")
+        return
+    client.send(encode_frame(f"[ЛС для {username}] {text}"))
+
+def command_who(client, argument):
+    """/who [страница]: пользователи по алфавиту"""
+    try:
+        number = max(int(argument or 1), 1)
+    except ValueError:
+        reply(client, "Использование: /who [страница]")
+        return
+    total, pages, names = presence.page(number)
+    if not names:
+        reply(client, f"Страница {number} пуста (всего страниц: {pages})")
+        return
+    # В режиме --workers список только своего процесса; общее число - по всему кластеру
+    scope = f" в этом процессе (всего в кластере {change_online(0)})" if hub is not None else ""
+    reply(client, f"В сети {total}{scope}, страница {number}/{pages}:\n" + ", ".join(names))
+
+def command_stats(client, argument):
+    """/stats: метрики очередей"""
+    reply(client, format_stats())
+
+# Команды чата: имя -> обработчик(клиент, аргумент)
+COMMANDS = {
+    '/join': command_join,
+    '/leave': command_leave,
+    '/rooms': command_rooms,
+    '/history': command_history,
+    '/msg': command_msg,
+    '/who': command_who,
+    '/stats': command_stats,
+}
+
+def handle_message(client, message):
+    """Обрабатывает одно сообщение клиента (команда или текст для комнаты)"""
+    client.last_seen = time.monotonic()
+    if not message:
+        # Пустой кадр - ответ на heartbeat
+        return
+    
+    if message.startswith('/'):
+        name, _, argument = message.strip().partition(' ')
+        command = COMMANDS.get(name)
+        if command is None:
+            reply(client, f"Неизвестная команда {name}. Доступны: {', '.join(COMMANDS)}")
+        else:
+            command(client, argument.strip())
+        return
+    
+    room = client.room
+    if room is None:
+        reply(client, "Вы не в комнате; /join <комната>")
+        return
+    
+    # Формируем и отправляем сообщение участникам комнаты
+    if room == DEFAULT_ROOM:
+        full_message = f"{client.username}: {message}"
+    else:
+        full_message = f"[{room}] {client.username}: {message}"
+    log(full_message)
+    broadcast(room, full_message, client, record=True)
+
+def check_idle_clients():
+    """Тик колеса таймеров: heartbeat молчащим клиентам, отключение неактивных.
+
+    Активность клиента только обновляет last_seen; таймер не переставляется
+    на каждое сообщение, а при срабатывании ставится заново на оставшееся время.
+    """
+    now = time.monotonic()
+    for client in timer_wheel.advance(now):
+        if client.outbox.closed:
+            continue
+        idle = now - client.last_seen
+        if idle_timeout > 0 and idle >= idle_timeout:
+            count('idle_disconnected')
+            log(f"[!] {client.username} не отвечает {idle:.0f} с, соединение закрыто")
+            client.outbox.close()
+            client.abort()
+        elif idle >= heartbeat_interval:
+            client.send(HEARTBEAT_FRAME)
+            remaining = idle_timeout - idle if idle_timeout > 0 else heartbeat_interval
+            timer_wheel.schedule(client, min(heartbeat_interval, remaining))
+        else:
+            timer_wheel.schedule(client, heartbeat_interval - idle)
+
+def run_timer_thread():
+    """Режим threads: колесо таймеров крутит отдельный поток"""
+    while True:
+        time.sleep(timer_wheel.tick)
+        check_idle_clients()
+
+async def run_timer_task():
+    """Режим async: колесо таймеров крутит задача на цикле событий"""
+    while True:
+        await asyncio.sleep(timer_wheel.tick)
+        check_idle_clients()
+
+def recv_messages(client_socket, decoder):
+    """Режим threads: сообщения клиента по одному, пока он не закроет соединение"""
+    while True:
+        data = client_socket.recv(RECV_BUFFER_SIZE)
+        if not data:
+            return
+        yield from decoder.feed(data)
+
+def write_loop(client_socket, outbox):
+    """Режим threads: писатель клиента отправляет все накопленные кадры одним sendmsg"""
+    try:
+        while True:
+            batch = outbox.take()
+            if batch is None:
+                break
+            send_frames(client_socket, batch)
+    except OSError:
+        # Клиент не принимает данные: будим читателя, он удалит клиента
+        abort_socket(client_socket)
+
+def abort_socket(client_socket):
+    """Обрывает соединение в обе стороны; recv в потоке читателя вернет b''"""
+    try:
+        client_socket.shutdown(socket.SHUT_RDWR)
+    except OSError:
+        pass
 
 def handle_client(client_socket, client_address):
     """Обрабатывает сообщения от одного клиента"""
-    print(f"[+] Новое подключение: {client_address}")
+    log(f"[+] Новое подключение: {client_address}")
+    writer_thread = None
     
     # Запрашиваем имя пользователя
     try:
-        client_socket.send("Введите ваше имя: ".encode('utf-8'))
-        username = client_socket.recv(1024).decode('utf-8').strip()
+        client_socket.sendall(encode_frame("Введите ваше имя: "))
+        messages = recv_messages(client_socket, FrameDecoder(MAX_MESSAGE_SIZE))
+        # До регистрации клиент не в колесе таймеров: имя ждем не дольше idle_timeout
+        client_socket.settimeout(idle_timeout or None)
+        username = next(messages, '').strip()
+        client_socket.settimeout(None)
         
         if not username:
             username = f"User_{client_address[1]}"
         
-        # Добавляем клиента в список
-        with clients_lock:
-            clients.append(client_socket)
-        
-        # Уведомляем всех о новом пользователе
-        join_message = f"\n[Сервер] {username} присоединился к чату!"
-        print(join_message)
-        broadcast(join_message, client_socket)
+        # Отправкой занимается отдельный поток, читатель никогда не ждет сеть на запись
+        outbox = ThreadOutbox(outbox_size, overflow_policy)
+        client = ChatClient(username, outbox, lambda: abort_socket(client_socket))
+        writer_thread = threading.Thread(target=write_loop, args=(client_socket, outbox), daemon=True)
+        writer_thread.start()
         
-        # Приветствуем нового пользователя
-        welcome_message = f"\nДобро пожаловать в чат, {username}!\nВсего пользователей онлайн: {len(clients)}\n"
-        client_socket.send(welcome_message.encode('utf-8'))
+        # Добавляем клиента в список
+        register(client_socket, client)
         
         # Основной цикл получения сообщений
-        while True:
-            try:
-                message = client_socket.recv(1024).decode('utf-8')
-                
-                if not message:
-                    break
-                
-                # Формируем и отправляем сообщение всем
-                full_message = f"{username}: {message}"
-                print(full_message)
-                broadcast(full_message, client_socket)
-                
-            except ConnectionResetError:
-                break
-            except Exception as e:
-                print(f"Ошибка при обработке сообщения от {username}: {e}")
-                break
+        try:
+            for message in messages:
+                handle_message(client, message)
+        except ConnectionResetError:
+            pass
+        except ProtocolError as e:
+            print(f"Клиент {username} нарушил протокол: {e}")
+            # Писатель дошлет объяснение перед закрытием соединения
+            client.send(protocol_error_frame(e))
+        except Exception as e:
+            print(f"Ошибка при обработке сообщения от {username}: {e}")
     
+    except ProtocolError as e:
+        print(f"Клиент {client_address} нарушил протокол: {e}")
+        try:
+            client_socket.sendall(protocol_error_frame(e))
+        except OSError:
+            pass
     except Exception as e:
         print(f"Ошибка при подключении клиента {client_address}: {e}")
     
     finally:
-        # Удаляем клиента из списка
-        with clients_lock:
-            if client_socket in clients:
-                clients.remove(client_socket)
-        
-        # Уведомляем всех об отключении
-        if 'username' in locals():
-            leave_message = f"\n[Сервер] {username} покинул чат."
-            print(leave_message)
-            broadcast(leave_message)
+        # Удаляем клиента из списка и уведомляем всех об отключении
+        unregister(client_socket)
         
-        # Закрываем соединение
+        # Даем писателю дослать очередь, затем закрываем соединение
+        if writer_thread is not None:
+            writer_thread.join(WRITE_TIMEOUT)
+            abort_socket(client_socket)
+            writer_thread.join()
         client_socket.close()
-        print(f"[-] Отключение: {client_address}")
+        log(f"[-] Отключение: {client_address}")
 
-def main():
+async def read_messages(reader, decoder):
+    """Режим async: сообщения клиента по одному, пока он не закроет соединение"""
+    while True:
+        data = await reader.read(RECV_BUFFER_SIZE)
+        if not data:
+            return
+        for message in decoder.feed(data):
+            yield message
+
+async def write_loop_async(writer, outbox):
+    """Режим async: писатель клиента; пока клиент не читает, копится его очередь.
+
+    Все накопленные кадры уходят одним writelines, а не отдельным write на каждый.
+    """
+    try:
+        while True:
+            batch = await outbox.take()
+            if batch is None:
+                break
+            writer.writelines(batch)
+            await writer.drain()
+    except ConnectionError:
+        writer.transport.abort()
+
+async def handle_async_client(reader, writer):
+    """Режим async: тот же протокол, что и handle_client, но в корутине"""
+    client_address = writer.get_extra_info('peername')
+    log(f"[+] Новое подключение: {client_address}")
+    writer_task = None
+    client = None
+    
+    try:
+        # Запрашиваем имя пользователя
+        writer.write(encode_frame("Введите ваше имя: "))
+        messages = read_messages(reader, FrameDecoder(MAX_MESSAGE_SIZE))
+        # До регистрации клиент не в колесе таймеров: имя ждем не дольше idle_timeout
+        username = (await asyncio.wait_for(anext(messages, ''), idle_timeout or None)).strip()
+        
+        if not username:
+            username = f"User_{client_address[1]}"
+        
+        outbox = AsyncOutbox(outbox_size, overflow_policy)
+        client = ChatClient(username, outbox, writer.transport.abort)
+        writer_task = asyncio.create_task(write_loop_async(writer, outbox))
+        register(writer, client)
+        
+        # Основной цикл получения сообщений
+        async for message in messages:
+            handle_message(client, message)
+    
+    except ConnectionError:
+        pass
+    except asyncio.TimeoutError:
+        log(f"[!] Клиент {client_address} не представился, соединение закрыто")
+    except ProtocolError as e:
+        print(f"Клиент {client_address} нарушил протокол: {e}")
+        if client is None:
+            writer.write(protocol_error_frame(e))
+        else:
+            client.send(protocol_error_frame(e))
+    except asyncio.CancelledError:
+        # Сервер останавливается
+        pass
+    except Exception as e:
+        print(f"Ошибка при обработке клиента {client_address}: {e}")
+    
+    finally:
+        unregister(writer)
+        
+        # Даем писателю дослать очередь, затем закрываем соединение
+        if writer_task is not None:
+            try:
+                await asyncio.wait_for(writer_task, WRITE_TIMEOUT)
+            except (asyncio.TimeoutError, asyncio.CancelledError):
+                writer.transport.abort()
+        writer.close()
+        log(f"[-] Отключение: {client_address}")
+
+async def serve_async(host, port, backlog, reuse_port=False):
+    """Режим async: все соединения в одном потоке на цикле событий"""
+    global event_loop
+    
+    event_loop = asyncio.get_running_loop()
+    timer_task = asyncio.create_task(run_timer_task())
+    server = await asyncio.start_server(
+        handle_async_client, host, port, backlog=backlog, limit=RECV_BUFFER_SIZE,
+        reuse_port=reuse_port,
+    )
+    
+    print("=" * 50)
+    print(f"Многопользовательский чат-сервер запущен (режим: async)")
+    print(f"Адрес: {host}:{port}")
+    print("=" * 50)
+    print("Ожидание подключений...\n")
+    
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        timer_task.cancel()
+        for writer in list(clients):
+            writer.close()
+        print(f"Счетчики очередей: {chat_stats}")
+
+def raise_open_files_limit():
+    """Поднимает мягкий лимит открытых файлов до жесткого (нужно для 10k соединений)"""
+    soft, hard = resource.getrlimit(resource.RLIMIT_NOFILE)
+    if hard == resource.RLIM_INFINITY or hard > soft:
+        try:
+            resource.setrlimit(resource.RLIMIT_NOFILE, (hard, hard))
+        except (ValueError, OSError):
+            return soft
+        return hard
+    return soft
+
+def serve_threads(host, port, backlog, reuse_port=False):
+    """Исходный режим: отдельный поток на каждого клиента"""
     # Создаем TCP сокет
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     
     # Позволяем переиспользовать адрес
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
-    
-    # Настройки сервера
-    host = 'localhost'
-    port = 9997
+    if reuse_port:
+        # Несколько процессов слушают один порт, ядро распределяет соединения
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     
     # Привязываем сокет к адресу и порту
     server_socket.bind((host, port))
     
     # Начинаем прослушивание
-    server_socket.listen(10)
+    server_socket.listen(backlog)
     
     print("=" * 50)
     print(f"Многопользовательский чат-сервер запущен")
@@ -109,6 +700,8 @@ def main():
     print("=" * 50)
     print("Ожидание подключений...\n")
     
+    threading.Thread(target=run_timer_thread, name='idle-timers', daemon=True).start()
+    
     try:
         while True:
             # Принимаем подключение
@@ -121,7 +714,7 @@ def main():
             )
             client_thread.daemon = True
             client_thread.start()
-            
+    
     except KeyboardInterrupt:
         print("\n\nОстановка сервера...")
     finally:
@@ -133,7 +726,179 @@ def main():
                 except:
                     pass
         server_socket.close()
+        print(f"Счетчики очередей: {chat_stats}")
         print("Сервер остановлен")
 
+def restore_history():
+    """Заполняет историю комнат последними записями журнала"""
+    for _, _, room, text in chat_log.tail(RESTORE_RECORDS):
+        room_history.append(room, encode_frame(text))
+
+def run_server(args, reuse_port=False):
+    """Запускает выбранный режим обслуживания соединений"""
+    if args.mode == 'async':
+        limit = raise_open_files_limit()
+        print(f"Лимит открытых файлов: {limit}")
+        try:
+            asyncio.run(serve_async(args.host, args.port, args.backlog, reuse_port))
+        except KeyboardInterrupt:
+            print("\n\nОстановка сервера...")
+            print("Сервер остановлен")
+    else:
+        serve_threads(args.host, args.port, args.backlog, reuse_port)
+
+def run_worker(args, slot, hub_path, slots, names_dir):
+    """Тело воркера: свой порт через SO_REUSEPORT и связь с концентратором"""
+    global hub, online_slots, worker_slot, presence
+    
+    online_slots = slots
+    worker_slot = slot
+    presence = PresenceRegistry(NameClaims(names_dir))
+    hub = HubClient(hub_path, on_hub_event)
+    hub.start()
+    try:
+        run_server(args, reuse_port=True)
+    finally:
+        hub.close()
+
+def spawn(target, *args):
+    """Запускает функцию в процессе-потомке через fork; возвращает pid"""
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            target(*args)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f"[!] Процесс {os.getpid()} упал: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def run_cluster(args):
+    """Супервизор: концентратор и N воркеров на одном порту; упавшие перезапускаются"""
+    socket_dir = tempfile.mkdtemp(prefix='chat-hub-')
+    hub_path = os.path.join(socket_dir, 'hub.sock')
+    # Имена пользователей, занятые во всех воркерах
+    names_dir = os.path.join(socket_dir, 'names')
+    os.mkdir(names_dir)
+    
+    # Счетчик онлайна у каждого воркера свой, чтобы при падении воркера
+    # супервизор мог обнулить именно его; создается до fork
+    slots = multiprocessing.Array('q', args.workers)
+    
+    print(f"Супервизор {os.getpid()}: концентратор {hub_path}, воркеров: {args.workers}")
+    hub_pid = spawn(run_hub, hub_path)
+    while not os.path.exists(hub_path):
+        time.sleep(0.05)
+    
+    # pid -> (номер счетчика или None для концентратора, время запуска)
+    children = {hub_pid: (None, time.monotonic())}
+    for slot in range(args.workers):
+        children[spawn(run_worker, args, slot, hub_path, slots, names_dir)] = (slot, time.monotonic())
+    
+    try:
+        while True:
+            pid, status = os.wait()
+            if pid not in children:
+                continue
+            slot, started = children.pop(pid)
+            name = "Концентратор" if slot is None else f"Воркер {slot}"
+            print(f"[!] {name} ({pid}) завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+            
+            # Не перезапускаем в цикле процесс, который падает сразу при старте
+            if time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            if slot is None:
+                if os.path.exists(hub_path):
+                    os.remove(hub_path)
+                children[spawn(run_hub, hub_path)] = (None, time.monotonic())
+            else:
+                # Клиенты упавшего воркера отключены вместе с ним, их имена свободны
+                with slots.get_lock():
+                    slots[slot] = 0
+                NameClaims(names_dir).release_owner(pid)
+                children[spawn(run_worker, args, slot, hub_path, slots, names_dir)] = (slot, time.monotonic())
+    
+    except KeyboardInterrupt:
+        print("\n\nОстановка процессов...")
+    finally:
+        for pid in children:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in children:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        shutil.rmtree(socket_dir, ignore_errors=True)
+        print("Сервер остановлен")
+
+def main():
+    global verbose, outbox_size, overflow_policy, room_history, chat_log
+    global heartbeat_interval, idle_timeout
+    
+    parser = argparse.ArgumentParser(description="Многопользовательский чат-сервер")
+    parser.add_argument('--mode', choices=['threads', 'async'], default='threads',
+                        help="threads - поток на клиента, async - asyncio (10k+ соединений)")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=9997)
+    parser.add_argument('--backlog', type=int,
+                        help=f"длина очереди listen() (по умолчанию {LISTEN_BACKLOG} для threads, "
+                             f"{ASYNC_LISTEN_BACKLOG} для async)")
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="не печатать каждое сообщение")
+    parser.add_argument('--outbox-size', type=int, default=OUTBOX_SIZE,
+                        help="сколько сообщений может ждать отправки одному клиенту")
+    parser.add_argument('--overflow', choices=OVERFLOW_POLICIES, default=OVERFLOW_POLICY,
+                        help="что делать при переполнении очереди клиента")
+    parser.add_argument('--history-size', type=int, default=HISTORY_SIZE,
+                        help="сколько последних сообщений комнаты показывать новым участникам (0 - не хранить)")
+    parser.add_argument('--history-bytes', type=int, default=HISTORY_BYTES,
+                        help="ограничение истории одной комнаты в байтах")
+    parser.add_argument('--log-dir',
+                        help="каталог журнала сообщений на диске (по умолчанию журнал не ведется)")
+    parser.add_argument('--log-segment-size', type=int, default=SEGMENT_SIZE,
+                        help="размер сегмента журнала в байтах")
+    parser.add_argument('--log-retention', type=int, default=RETENTION_SEGMENTS,
+                        help="сколько сегментов журнала хранить")
+    parser.add_argument('--heartbeat-interval', type=float, default=HEARTBEAT_INTERVAL,
+                        help="через сколько секунд тишины отправлять клиенту heartbeat")
+    parser.add_argument('--idle-timeout', type=float, default=IDLE_TIMEOUT,
+                        help="через сколько секунд тишины отключать клиента (0 - не отключать)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число процессов на одном порту (SO_REUSEPORT), связанных концентратором")
+    args = parser.parse_args()
+    if args.backlog is None:
+        args.backlog = ASYNC_LISTEN_BACKLOG if args.mode == 'async' else LISTEN_BACKLOG
+    if args.workers > 1 and args.log_dir:
+        parser.error("--log-dir пока не поддерживается вместе с --workers")
+    verbose = not args.quiet
+    outbox_size = args.outbox_size
+    overflow_policy = args.overflow
+    room_history = HistoryStore(args.history_size, args.history_bytes)
+    heartbeat_interval = args.heartbeat_interval
+    idle_timeout = args.idle_timeout
+    
+    if args.log_dir:
+        chat_log = ChatLog(args.log_dir, args.log_segment_size, args.log_retention)
+        chat_log.open()
+        restore_history()
+        print(f"Журнал сообщений: {args.log_dir} (следующая запись {chat_log.next_seq})")
+    
+    if args.workers > 1:
+        run_cluster(args)
+        return
+    
+    try:
+        run_server(args)
+    finally:
+        if chat_log is not None:
+            chat_log.close()
+
 if __name__ == "__main__":
     main()
@@ -0,0 +1,237 @@
+#!/usr/bin/env python3
+"""
+Задание 5: Индекс оценок для сортировки, фильтрации и постраничного вывода
+Отсортированные массивы рядом со словарем grades, поддерживаются через bisect
+"""
+
+import bisect
+import heapq
+import urllib.parse
+
+# Допустимые оценки
+MIN_GRADE = 2
+MAX_GRADE = 5
+
+# Порядок вывода: по добавлению, по названию, по оценке
+SORT_FIELDS = ('added', 'name', 'grade')
+
+# Строк на странице по умолчанию и максимум
+PAGE_SIZE = 50
+MAX_PAGE_SIZE = 1000
+
+# Параметры, включающие постраничный вывод (остальные, например utm_*, не влияют)
+QUERY_PARAMS = ('sort', 'order', 'min', 'max', 'page', 'per_page')
+
+class GradeQuery:
+    """Параметры выборки: сортировка, диапазон оценок и страница"""
+    
+    __slots__ = ('sort', 'descending', 'min_grade', 'max_grade', 'page', 'per_page')
+    
+    def __init__(self, sort='added', descending=False, min_grade=MIN_GRADE,
+                 max_grade=MAX_GRADE, page=1, per_page=PAGE_SIZE):
+        self.sort = sort
+        self.descending = descending
+        self.min_grade = min_grade
+        self.max_grade = max_grade
+        self.page = page
+        self.per_page = per_page
+    
+    @property
+    def offset(self):
+        return (self.page - 1) * self.per_page
+    
+    @property
+    def filtered(self):
+        """Ограничен ли диапазон оценок"""
+        return self.min_grade > MIN_GRADE or self.max_grade < MAX_GRADE
+    
+    def key(self):
+        """Ключ для кэша ответов"""
+        return (self.sort, self.descending, self.min_grade, self.max_grade,
+                self.page, self.per_page)
+    
+    def to_query_string(self, **changes):
+        """Строка запроса для ссылки на другую страницу или сортировку"""
+        params = {
+            'sort': self.sort,
+            'order': 'desc' if self.descending else 'asc',
+            'min': self.min_grade,
+            'max': self.max_grade,
+            'page': self.page,
+            'per_page': self.per_page,
+        }
+        params.update(changes)
+        return '?' + urllib.parse.urlencode(params)
+
+def parse_grade_query(query_string):
+    """Разбирает ?sort=&order=&min=&max=&page=&per_page=.
+
+    Возвращает None, если параметров нет (выводится вся таблица).
+    Неверные значения заменяются значениями по умолчанию.
+    """
+    params = urllib.parse.parse_qs(query_string)
+    if not any(name in params for name in QUERY_PARAMS):
+        return None
+    
+    def number(name, default, low, high):
+        try:
+            value = int(params[name][0])
+        except (KeyError, ValueError):
+            return default
+        return min(max(value, low), high)
+    
+    sort = params.get('sort', ['added'])[0]
+    if sort not in SORT_FIELDS:
+        sort = 'added'
+    
+    min_grade = number('min', MIN_GRADE, MIN_GRADE, MAX_GRADE)
+    max_grade = number('max', MAX_GRADE, min_grade, MAX_GRADE)
+    
+    return GradeQuery(
+        sort=sort,
+        descending=params.get('order', ['asc'])[0] == 'desc',
+        min_grade=min_grade,
+        max_grade=max_grade,
+        page=number('page', 1, 1, 10 ** 9),
+        per_page=number('per_page', PAGE_SIZE, 1, MAX_PAGE_SIZE),
+    )
+
+def split_runs(runs, rank):
+    """Позиции в отсортированных отрезках, до которых лежат rank наименьших элементов их объединения.
+
+    Элементы разных отрезков не совпадают. Для каждого отрезка бинарным
+    поиском ищется элемент, меньше которого ровно rank элементов во всех
+    отрезках: O(m * log² n) для m отрезков, без просмотра первых rank.
+    """
+    total = sum(len(run) for run in runs)
+    if rank <= 0:
+        return [0] * len(runs)
+    if rank >= total:
+        return [len(run) for run in runs]
+    
+    for run in runs:
+        low, high = 0, len(run)
+        while low < high:
+            middle = (low + high) // 2
+            below = sum(bisect.bisect_left(other, run[middle]) for other in runs)
+            if below < rank:
+                low = middle + 1
+            else:
+                high = middle
+        if low < len(run):
+            positions = [bisect.bisect_left(other, run[low]) for other in runs]
+            if sum(positions) == rank:
+                return positions
+    raise AssertionError("элементы отрезков повторяются")
+
+def page_of_runs(runs, start, stop, descending):
+    """Элементы объединения отрезков с номерами [start, stop) в нужном порядке"""
+    total = sum(len(run) for run in runs)
+    if descending:
+        start, stop = total - stop, total - start
+    begin = split_runs(runs, start)
+    end = split_runs(runs, stop)
+    page = list(heapq.merge(*(run[b:e] for run, b, e in zip(runs, begin, end))))
+    if descending:
+        page.reverse()
+    return page
+
+class GradeIndex:
+    """Индексы поверх словаря grades.
+
+    by_name - названия дисциплин по алфавиту, by_grade - пары
+    (оценка, дисциплина) по возрастанию, added - названия в порядке
+    добавления. Для выборок с фильтром по оценке у каждой оценки есть
+    свои отрезки: names_of - названия по алфавиту, added_of - пары
+    (номер добавления, название). Вставка стоит O(n) на сдвиг массива
+    (memmove), зато число подходящих строк считается за O(log n),
+    а страница из k строк выбирается за O(log² n + k) при любом смещении.
+    """
+    
+    def __init__(self):
+        self.by_name = []
+        self.by_grade = []
+        self.added = []
+        self.names_of = {grade: [] for grade in range(MIN_GRADE, MAX_GRADE + 1)}
+        self.added_of = {grade: [] for grade in range(MIN_GRADE, MAX_GRADE + 1)}
+        self.sequence = {}
+    
+    def rebuild(self, grades):
+        """Строит индексы заново по словарю"""
+        self.by_name = sorted(grades)
+        self.by_grade = sorted((grade, subject) for subject, grade in grades.items())
+        self.added = list(grades)
+        self.sequence = {subject: number for number, subject in enumerate(self.added)}
+        for grade in self.names_of:
+            self.names_of[grade] = []
+            self.added_of[grade] = []
+        for grade, subject in self.by_grade:
+            self.names_of[grade].append(subject)
+        for subject in self.added:
+            self.added_of[grades[subject]].append((self.sequence[subject], subject))
+    
+    def update(self, subject, old_grade, grade):
+        """Учитывает изменение одной оценки (old_grade=None для новой дисциплины)"""
+        if old_grade is None:
+            bisect.insort(self.by_name, subject)
+            self.sequence[subject] = len(self.added)
+            self.added.append(subject)
+        elif old_grade == grade:
+            return
+        else:
+            position = bisect.bisect_left(self.by_grade, (old_grade, subject))
+            del self.by_grade[position]
+            self._discard(self.names_of[old_grade], subject)
+            self._discard(self.added_of[old_grade], (self.sequence[subject], subject))
+        bisect.insort(self.by_grade, (grade, subject))
+        bisect.insort(self.names_of[grade], subject)
+        bisect.insort(self.added_of[grade], (self.sequence[subject], subject))
+    
+    @staticmethod
+    def _discard(run, item):
+        position = bisect.bisect_left(run, item)
+        if position < len(run) and run[position] == item:
+            del run[position]
+    
+    def grade_range(self, min_grade, max_grade):
+        """Границы среза by_grade для оценок из [min_grade, max_grade]"""
+        low = bisect.bisect_left(self.by_grade, (min_grade,))
+        high = bisect.bisect_left(self.by_grade, (max_grade + 1,))
+        return low, high
+    
+    def query(self, query, grades):
+        """Возвращает (число подходящих строк, строки страницы)"""
+        low, high = self.grade_range(query.min_grade, query.max_grade)
+        total = high - low
+        start = query.offset
+        stop = min(start + query.per_page, total)
+        if start >= total:
+            return total, []
+        
+        if query.sort == 'grade':
+            # Срез индекса по оценке: O(log n + k)
+            if query.descending:
+                items = reversed(self.by_grade[high - stop:high - start])
+            else:
+                items = self.by_grade[low + start:low + stop]
+            return total, [(subject, grade) for grade, subject in items]
+        
+        if not query.filtered:
+            # Без фильтра страница - прямой срез нужного массива
+            names = self.by_name if query.sort == 'name' else self.added
+            if query.descending:
+                page = reversed(names[len(names) - stop:len(names) - start])
+            else:
+                page = names[start:stop]
+            return total, [(subject, grades[subject]) for subject in page]
+        
+        # С фильтром: страница из отрезков подходящих оценок (их не больше четырех),
+        # границы находятся бинарным поиском, а не просмотром первых offset строк
+        selected = range(query.min_grade, query.max_grade + 1)
+        if query.sort == 'name':
+            page = page_of_runs([self.names_of[grade] for grade in selected],
+                                start, stop, query.descending)
+        else:
+            page = [subject for _, subject in page_of_runs(
+                [self.added_of[grade] for grade in selected], start, stop, query.descending)]
+        return total, [(subject, grades[subject]) for subject in page]
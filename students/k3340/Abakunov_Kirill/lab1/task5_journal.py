@@ -0,0 +1,276 @@
+#!/usr/bin/env python3
+"""
+Задание 5: Журнал оценок на диске
+Журнал изменений (append-only) с групповой фиксацией и снапшотами
+"""
+
+import mmap
+import os
+import struct
+import threading
+import zlib
+
+# Поля записи: длина названия дисциплины в байтах и оценка, затем название
+RECORD_FIELDS = struct.Struct('<HB')
+
+# Запись журнала: crc32 полей и названия, затем сама запись
+RECORD_HEADER = struct.Struct('<IHB')
+
+# Самое длинное название дисциплины в байтах UTF-8 (длина хранится в uint16)
+MAX_SUBJECT_SIZE = 0xFFFF
+
+# Снапшот: сигнатура, число записей, записи; в конце файла crc32 содержимого
+SNAPSHOT_MAGIC = b'GRSN'
+SNAPSHOT_HEADER = struct.Struct('<4sI')
+SNAPSHOT_CRC = struct.Struct('<I')
+
+# Как часто фоновый поток сбрасывает накопленные записи на диск (секунды)
+COMMIT_INTERVAL = 0.05
+
+# После скольких записей в журнале делается новый снапшот
+SNAPSHOT_EVERY = 10000
+
+def journal_name(index):
+    return f"journal.{index:08d}"
+
+def snapshot_name(index):
+    return f"snapshot.{index:08d}"
+
+def encode_record(subject, grade):
+    """Кодирует одну запись журнала"""
+    name = subject.encode('utf-8')
+    crc = zlib.crc32(name, zlib.crc32(RECORD_FIELDS.pack(len(name), grade)))
+    return RECORD_HEADER.pack(crc, len(name), grade) + name
+
+class GradeJournal:
+    """Журнал изменений оценок.
+
+    Запись идет в два шага: encode_batch() кодирует пачку, append_records()
+    только кладет ее в очередь, поэтому POST-запрос не ждет диска. Фоновый
+    поток раз в COMMIT_INTERVAL записывает всю накопленную пачку одним
+    write и делает один fsync (групповая фиксация).
+
+    Журнал разбит на файлы journal.N. Снапшот snapshot.N содержит состояние,
+    включающее все записи журналов с номером меньше N, поэтому при запуске
+    читается последний снапшот и проигрываются только журналы начиная с N.
+    Запись «дисциплина = оценка» идемпотентна, так что повторное применение
+    записи, уже попавшей в снапшот, ничего не портит.
+    """
+    
+    def __init__(self, directory, commit_interval=COMMIT_INTERVAL,
+                 snapshot_every=SNAPSHOT_EVERY):
+        self.directory = directory
+        self.commit_interval = commit_interval
+        self.snapshot_every = snapshot_every
+        os.makedirs(directory, exist_ok=True)
+        
+        self.lock = threading.Lock()
+        self.wakeup = threading.Condition(self.lock)
+        self.pending = []
+        self.stopped = False
+        self.records_since_snapshot = 0
+        
+        self.index = 0
+        self.file = None
+        self.thread = None
+        # Функция, возвращающая копию текущего состояния для снапшота
+        self.state_provider = None
+    
+    def _path(self, name):
+        return os.path.join(self.directory, name)
+    
+    def _indexes(self, prefix):
+        """Номера файлов вида prefix.N в каталоге, по возрастанию"""
+        result = []
+        for name in os.listdir(self.directory):
+            base, _, suffix = name.partition('.')
+            if base == prefix and suffix.isdigit():
+                result.append(int(suffix))
+        return sorted(result)
+    
+    def load(self):
+        """Восстанавливает состояние: последний снапшот + хвост журнала.
+
+        Возвращает словарь {дисциплина: оценка}.
+        """
+        state = {}
+        snapshots = self._indexes('snapshot')
+        base = 0
+        while snapshots:
+            candidate = snapshots.pop()
+            loaded = self._read_snapshot(self._path(snapshot_name(candidate)))
+            if loaded is not None:
+                state = loaded
+                base = candidate
+                break
+            print(f"[!] Снапшот {snapshot_name(candidate)} поврежден, пропускаем")
+        
+        journals = [i for i in self._indexes('journal') if i >= base]
+        for index in journals:
+            self.records_since_snapshot += self._replay(
+                self._path(journal_name(index)), state
+            )
+        
+        # Новые записи дописываются в последний журнал
+        self.index = journals[-1] if journals else base
+        return state
+    
+    def _read_snapshot(self, path):
+        """Читает снапшот через отображение файла в память"""
+        with open(path, 'rb') as file:
+            size = os.fstat(file.fileno()).st_size
+            if size < SNAPSHOT_HEADER.size + SNAPSHOT_CRC.size:
+                return None
+            with mmap.mmap(file.fileno(), 0, access=mmap.ACCESS_READ) as mapped:
+                view = memoryview(mapped)
+                try:
+                    body_end = size - SNAPSHOT_CRC.size
+                    (crc,) = SNAPSHOT_CRC.unpack_from(view, body_end)
+                    if zlib.crc32(view[:body_end]) != crc:
+                        return None
+                    
+                    magic, count = SNAPSHOT_HEADER.unpack_from(view, 0)
+                    if magic != SNAPSHOT_MAGIC:
+                        return None
+                    
+                    state = {}
+                    pos = SNAPSHOT_HEADER.size
+                    for _ in range(count):
+                        length, grade = RECORD_FIELDS.unpack_from(view, pos)
+                        pos += RECORD_FIELDS.size
+                        state[str(view[pos:pos + length], 'utf-8')] = grade
+                        pos += length
+                    return state
+                finally:
+                    view.release()
+    
+    def _replay(self, path, state):
+        """Применяет записи журнала к state; обрезает недописанный хвост"""
+        with open(path, 'rb') as file:
+            data = file.read()
+        
+        view = memoryview(data)
+        pos = 0
+        applied = 0
+        while pos + RECORD_HEADER.size <= len(data):
+            crc, length, grade = RECORD_HEADER.unpack_from(view, pos)
+            start = pos + RECORD_HEADER.size
+            end = start + length
+            if end > len(data):
+                break
+            check = zlib.crc32(view[start:end], zlib.crc32(RECORD_FIELDS.pack(length, grade)))
+            if check != crc:
+                break
+            state[str(view[start:end], 'utf-8')] = grade
+            applied += 1
+            pos = end
+        view.release()
+        
+        # Запись, оборванная при сбое, отбрасывается
+        if pos < len(data):
+            print(f"[!] Журнал {os.path.basename(path)}: отброшен хвост {len(data) - pos} байт")
+            with open(path, 'r+b') as file:
+                file.truncate(pos)
+        return applied
+    
+    def start(self, state_provider):
+        """Открывает журнал на дозапись и запускает поток фиксации"""
+        self.state_provider = state_provider
+        self.file = open(self._path(journal_name(self.index)), 'ab')
+        self.thread = threading.Thread(target=self._run, name='grade-journal', daemon=True)
+        self.thread.start()
+    
+    def encode_batch(self, updates):
+        """Кодирует пачку заранее: ошибка кодирования не должна оставить ее примененной наполовину"""
+        return [encode_record(subject, grade) for subject, grade in updates]
+    
+    def append_records(self, records):
+        """Ставит в очередь записи, закодированные encode_batch (не ждет диска)"""
+        with self.lock:
+            self.pending.extend(records)
+    
+    def close(self):
+        """Сбрасывает оставшиеся записи и останавливает поток"""
+        if self.thread is None:
+            return
+        with self.wakeup:
+            self.stopped = True
+            self.wakeup.notify()
+        self.thread.join()
+        self.thread = None
+        self.file.close()
+    
+    def _run(self):
+        while True:
+            with self.wakeup:
+                if not self.stopped:
+                    self.wakeup.wait(self.commit_interval)
+                batch = self.pending
+                self.pending = []
+                stopped = self.stopped
+            
+            if batch:
+                self._commit(batch)
+                self.records_since_snapshot += len(batch)
+                if self.records_since_snapshot >= self.snapshot_every:
+                    self._snapshot()
+            
+            if stopped:
+                return
+    
+    def _commit(self, batch):
+        """Одна запись и один fsync на всю пачку"""
+        self.file.write(b''.join(batch))
+        self.file.flush()
+        os.fsync(self.file.fileno())
+    
+    def _snapshot(self):
+        """Переключается на новый журнал и сохраняет снапшот состояния"""
+        with self.lock:
+            # Все, что попало в очередь до переключения, уходит в старый журнал
+            batch = self.pending
+            self.pending = []
+            # Копия словаря в CPython атомарна относительно других потоков
+            state = self.state_provider()
+        if batch:
+            self._commit(batch)
+        
+        old_index = self.index
+        self.index += 1
+        self.file.close()
+        self.file = open(self._path(journal_name(self.index)), 'ab')
+        
+        self._write_snapshot(state, self._path(snapshot_name(self.index)))
+        self.records_since_snapshot = 0
+        
+        # Старые журналы и снапшоты больше не нужны
+        for index in self._indexes('journal'):
+            if index <= old_index:
+                os.remove(self._path(journal_name(index)))
+        for index in self._indexes('snapshot'):
+            if index < self.index:
+                os.remove(self._path(snapshot_name(index)))
+    
+    def _write_snapshot(self, state, path):
+        """Атомарно записывает снапшот: временный файл, fsync, rename"""
+        parts = [SNAPSHOT_HEADER.pack(SNAPSHOT_MAGIC, len(state))]
+        for subject, grade in state.items():
+            name = subject.encode('utf-8')
+            parts.append(RECORD_FIELDS.pack(len(name), grade))
+            parts.append(name)
+        data = b''.join(parts)
+        data += SNAPSHOT_CRC.pack(zlib.crc32(data))
+        
+        tmp_path = path + '.tmp'
+        with open(tmp_path, 'wb') as file:
+            file.write(data)
+            file.flush()
+            os.fsync(file.fileno())
+        os.replace(tmp_path, path)
+        
+        # Фиксируем само переименование в каталоге
+        dir_fd = os.open(self.directory, os.O_RDONLY)
+        try:
+            os.fsync(dir_fd)
+        finally:
+            os.close(dir_fd)
@@ -4,45 +4,265 @@
 Принимает информацию о дисциплинах и оценках, отображает их в HTML
 """
 
+import argparse
+import asyncio
+import html
+import json
+import multiprocessing
+import os
+import signal
 import socket
+import tempfile
+import time
 import urllib.parse
+import zlib
+
+from task5_grade_index import GradeIndex, parse_grade_query
+from task5_journal import MAX_SUBJECT_SIZE, GradeJournal
+from task5_shared_store import SharedGradeStore
 
 # Хранилище оценок (дисциплина: оценка)
 grades = {}
 
-def parse_request(request):
-    """Парсит HTTP-запрос"""
-    lines = request.split('\r\n')
-    if not lines:
-        return None, None, None
-    
-    # Парсим первую строку (метод, путь, протокол)
-    first_line = lines[0].split()
-    if len(first_line) < 3:
-        return None, None, None
-    
-    method = first_line[0]
-    path = first_line[1]
-    
-    # Парсим заголовки
-    headers = {}
-    body_start = 0
-    for i, line in enumerate(lines[1:], 1):
-        if line == '':
-            body_start = i + 1
-            break
-        if ':' in line:
-            key, value = line.split(':', 1)
-            headers[key.strip()] = value.strip()
-    
-    # Получаем тело запроса
-    body = '\r\n'.join(lines[body_start:]) if body_start > 0 else ''
-    
-    return method, path, body
-
-def generate_html_page():
-    """Генерирует HTML-страницу с формой и таблицей оценок"""
-    html = """<!DOCTYPE html>
+# Сумма всех оценок (поддерживается при каждой вставке, для среднего балла)
+grades_total = 0
+
+# Отсортированные индексы grades для выборок с сортировкой и страницами
+grade_index = GradeIndex()
+
+# Номер версии grades: увеличивается при каждом изменении
+grades_generation = 0
+
+# Кэш готовых ответов на GET: (версия grades, keep_alive, кодирование) -> байты ответа
+page_cache = {}
+
+# Отдельный кэш выборок (?sort=...&page=...): их много, и они не должны вытеснять главную страницу
+query_cache = {}
+
+# Сколько разных выборок кэшируется на одну версию grades
+QUERY_CACHE_LIMIT = 256
+
+# Начиная с какого числа дисциплин страница отправляется потоком (chunked)
+STREAM_THRESHOLD = 1000
+
+# Сколько строк таблицы кодируется в один кусок
+ROWS_PER_CHUNK = 500
+
+# Журнал изменений на диске (включается флагом --data-dir)
+journal = None
+
+# Общее хранилище воркеров в режиме pre-fork и номер последнего примененного изменения
+shared_store = None
+applied_seq = 0
+
+# Пауза перед перезапуском воркера, который упал сразу после старта (секунды)
+RESPAWN_DELAY = 1.0
+
+# Поддерживаемые Content-Encoding и параметр wbits для zlib (в порядке предпочтения)
+CONTENT_ENCODINGS = {'gzip': 31, 'deflate': 15}
+
+# Уровень сжатия страницы
+COMPRESSION_LEVEL = 6
+
+# Префикс ETag уникален для запуска, чтобы ETag прошлых запусков не совпадали
+ETAG_EPOCH = os.urandom(4).hex()
+
+# Сколько секунд держим простаивающее keep-alive соединение
+KEEPALIVE_TIMEOUT = 15
+
+# Ограничения на размер заголовков и тела запроса (байты)
+MAX_HEADER_SIZE = 8 * 1024
+MAX_BODY_SIZE = 64 * 1024
+
+# Адрес API для машинного импорта и выгрузки оценок и лимит тела для него
+API_GRADES_PATH = '/api/grades'
+MAX_API_BODY_SIZE = 8 * 1024 * 1024
+BODY_LIMITS = {API_GRADES_PATH: MAX_API_BODY_SIZE}
+
+# Размер блока для чтения из сокета
+RECV_BUFFER_SIZE = 64 * 1024
+
+# Ограничения соединений по умолчанию (меняются флагами командной строки)
+READ_TIMEOUT = 10.0
+WRITE_TIMEOUT = 10.0
+MAX_CONNECTIONS = 10000
+LISTEN_BACKLOG = 1024
+
+# Секунд на получение запроса целиком и на отправку ответа
+read_timeout = READ_TIMEOUT
+write_timeout = WRITE_TIMEOUT
+
+# Сколько соединений обслуживается одновременно (режим async); остальным - 503
+max_connections = MAX_CONNECTIONS
+
+# Длина очереди ожидающих accept соединений
+listen_backlog = LISTEN_BACKLOG
+
+# Счетчики соединений (отдаются по GET /api/stats)
+STATS_PATH = '/api/stats'
+connection_stats = {'accepted': 0, 'active': 0, 'rejected': 0, 'timed_out': 0}
+
+# Быстрый отказ при перегрузке: без чтения запроса и без рендера страницы
+OVERLOAD_RESPONSE = (b"HTTP/1.1 503 Service Unavailable\r\n"
+                     b"Retry-After: 1\r\n"
+                     b"Content-Length: 0\r\n"
+                     b"Connection: close\r\n"
+                     b"\r\n")
+
+# Выводить ли строку в консоль на каждый запрос
+verbose = True
+
+class HTTPError(Exception):
+    """Ошибка в запросе, о которой нужно сообщить клиенту кодом ответа"""
+    
+    def __init__(self, status, reason):
+        super().__init__(f"{status} {reason}")
+        self.status = status
+        self.reason = reason
+
+class HTTPRequest:
+    """Разобранный HTTP-запрос"""
+    
+    __slots__ = ('method', 'path', 'version', 'headers', 'body')
+    
+    def __init__(self, method, path, version, headers, body=b''):
+        self.method = method
+        self.path = path
+        self.version = version
+        # Имена заголовков приводятся к нижнему регистру
+        self.headers = headers
+        self.body = body
+    
+    @property
+    def keep_alive(self):
+        """Нужно ли оставить соединение открытым после ответа"""
+        connection = self.headers.get('connection', '').lower()
+        if self.version == 'HTTP/1.1':
+            return connection != 'close'
+        return connection == 'keep-alive'
+
+class RequestParser:
+    """Инкрементальный парсер HTTP-запросов поверх приемного буфера.
+    
+    Данные дописываются в один bytearray через feed(), а next_request()
+    возвращает очередной полный запрос или None, если данных пока мало.
+    Строка запроса и заголовки читаются срезами memoryview прямо из буфера,
+    тело копируется один раз и только когда пришло целиком (по Content-Length).
+    """
+    
+    def __init__(self, max_header_size=MAX_HEADER_SIZE, max_body_size=MAX_BODY_SIZE,
+                 body_limits=None):
+        self.max_header_size = max_header_size
+        self.max_body_size = max_body_size
+        # Отдельные лимиты тела для путей: {путь: байты}
+        self.body_limits = body_limits or {}
+        self.buffer = bytearray()
+        # Смещение начала необработанных данных в буфере
+        self.start = 0
+        # Заголовки запроса, для которого еще не пришло тело
+        self.pending = None
+        self.body_length = 0
+    
+    def feed(self, data):
+        """Добавляет полученные из сокета байты в буфер"""
+        self.buffer += data
+    
+    def has_partial_request(self):
+        """Получена ли часть следующего запроса"""
+        return self.pending is not None or len(self.buffer) > self.start
+    
+    def next_request(self):
+        """Возвращает следующий полный запрос или None"""
+        buffer = self.buffer
+        
+        if self.pending is None:
+            head_end = buffer.find(b'\r\n\r\n', self.start)
+            if head_end < 0:
+                if len(buffer) - self.start > self.max_header_size:
+                    raise HTTPError(431, "Request Header Fields Too Large")
+                return None
+            if head_end - self.start > self.max_header_size:
+                raise HTTPError(431, "Request Header Fields Too Large")
+            
+            self.pending = self._parse_head(self.start, head_end)
+            self.start = head_end + 4
+            self.body_length = self._content_length(self.pending)
+        
+        body_end = self.start + self.body_length
+        if len(buffer) < body_end:
+            return None
+        
+        request = self.pending
+        if self.body_length:
+            with memoryview(buffer) as view:
+                request.body = bytes(view[self.start:body_end])
+        self.pending = None
+        self.start = body_end
+        self._compact()
+        return request
+    
+    def _parse_head(self, start, end):
+        """Разбирает строку запроса и заголовки в границах буфера"""
+        buffer = self.buffer
+        with memoryview(buffer) as view:
+            # Строка запроса: метод, путь, протокол
+            line_end = buffer.find(b'\r\n', start, end)
+            if line_end < 0:
+                line_end = end
+            first_space = buffer.find(b' ', start, line_end)
+            second_space = buffer.find(b' ', first_space + 1, line_end)
+            if first_space < 0 or second_space < 0:
+                raise HTTPError(400, "Bad Request")
+            
+            try:
+                method = str(view[start:first_space], 'ascii')
+                path = str(view[first_space + 1:second_space], 'utf-8')
+                version = str(view[second_space + 1:line_end], 'ascii')
+            except UnicodeDecodeError:
+                raise HTTPError(400, "Bad Request") from None
+            
+            # Заголовки
+            headers = {}
+            pos = line_end + 2
+            while pos < end:
+                line_end = buffer.find(b'\r\n', pos, end)
+                if line_end < 0:
+                    line_end = end
+                colon = buffer.find(b':', pos, line_end)
+                if colon > pos:
+                    key = str(view[pos:colon], 'latin-1').strip().lower()
+                    headers[key] = str(view[colon + 1:line_end], 'latin-1').strip()
+                pos = line_end + 2
+        
+        return HTTPRequest(method, path, version, headers)
+    
+    def _content_length(self, request):
+        """Проверяет Content-Length и ограничение на размер тела"""
+        headers = request.headers
+        if 'transfer-encoding' in headers:
+            raise HTTPError(501, "Not Implemented")
+        
+        value = headers.get('content-length', '0')
+        # isdigit() пропускает и не-ASCII цифры вроде '²', которые int() не принимает
+        if not (value.isascii() and value.isdigit()):
+            raise HTTPError(400, "Bad Request")
+        length = int(value)
+        path = request.path.split('?', 1)[0]
+        if length > self.body_limits.get(path, self.max_body_size):
+            raise HTTPError(413, "Payload Too Large")
+        return length
+    
+    def _compact(self):
+        """Сдвигает буфер, когда обработанные данные занимают его большую часть"""
+        if self.start == len(self.buffer):
+            self.buffer.clear()
+            self.start = 0
+        elif self.start > len(self.buffer) // 2:
+            del self.buffer[:self.start]
+            self.start = 0
+
+# Неизменная часть страницы: стили, заголовок и форма (кодируется один раз)
+PAGE_HEAD = """<!DOCTYPE html>
 <html lang="ru">
 <head>
     <meta charset="UTF-8">
@@ -228,6 +448,21 @@ def generate_html_page():
             color: #666;
             margin-top: 5px;
         }
+        
+        .pagination {
+            display: flex;
+            flex-wrap: wrap;
+            justify-content: space-between;
+            gap: 10px;
+            margin-top: 20px;
+            color: #666;
+        }
+        
+        .pagination a {
+            color: #667eea;
+            text-decoration: none;
+            font-weight: 600;
+        }
     </style>
 </head>
 <body>
@@ -254,14 +489,16 @@ def generate_html_page():
         
         <div class="grades-section">
             <h2>Список оценок</h2>
-"""
-    
-    if grades:
-        # Вычисляем статистику
-        total_subjects = len(grades)
-        average_grade = sum(grades.values()) / total_subjects if total_subjects > 0 else 0
-        
-        html += f"""
+""".encode('utf-8')
+
+PAGE_EMPTY_STATE = """
+            <div class="empty-state">
+                <p>Пока нет добавленных оценок</p>
+                <p>Используйте форму выше для добавления первой оценки</p>
+            </div>
+""".encode('utf-8')
+
+STATS_TEMPLATE = """
             <div class="stats">
                 <div class="stat-item">
                     <div class="stat-value">{total_subjects}</div>
@@ -283,48 +520,360 @@ def generate_html_page():
                 </thead>
                 <tbody>
 """
-        for idx, (subject, grade) in enumerate(grades.items(), 1):
-            html += f"""
+
+ROW_TEMPLATE = """
                     <tr>
-                        <td>{idx}</td>
-                        <td>{subject}</td>
-                        <td>{grade}</td>
+                        <td>{}</td>
+                        <td>{}</td>
+                        <td>{}</td>
                     </tr>
 """
-        html += """
+
+TABLE_END = """
                 </tbody>
             </table>
-"""
-    else:
-        html += """
-            <div class="empty-state">
-                <p>Пока нет добавленных оценок</p>
-                <p>Используйте форму выше для добавления первой оценки</p>
+""".encode('utf-8')
+
+PAGINATION_TEMPLATE = """
+            <div class="pagination">
+                <span>Найдено: {total} · страница {page} из {pages}</span>
+                <span>{prev_link} {next_link}</span>
+                <span>Сортировка: {sort_links}</span>
             </div>
 """
-    
-    html += """
+
+SORT_LABELS = {'added': 'по добавлению', 'name': 'по названию', 'grade': 'по оценке'}
+
+PAGE_TAIL = """
         </div>
     </div>
 </body>
 </html>
-"""
-    return html
+""".encode('utf-8')
+
+def precompress_head(wbits):
+    """Сжимает неизменную часть страницы один раз при запуске.
+    
+    Возвращает сжатые байты и компрессор, остановленный после PAGE_HEAD:
+    его копия дожимает динамическую часть в тот же поток.
+    """
+    compressor = zlib.compressobj(COMPRESSION_LEVEL, zlib.DEFLATED, wbits)
+    prefix = compressor.compress(PAGE_HEAD) + compressor.flush(zlib.Z_FULL_FLUSH)
+    return prefix, compressor
 
-def handle_get_request():
-    """Обрабатывает GET-запрос"""
-    html = generate_html_page()
+COMPRESSED_HEADS = {
+    encoding: precompress_head(wbits) for encoding, wbits in CONTENT_ENCODINGS.items()
+}
+
+def generate_html_page(query=None):
+    """Генерирует HTML-страницу с формой и таблицей оценок кусками байтов"""
+    yield PAGE_HEAD
+    yield from generate_grades_section(query)
+
+def render_pagination(query, total):
+    """Ссылки на соседние страницы и переключатель сортировки"""
+    def link(**changes):
+        return '/' + html.escape(query.to_query_string(**changes))
+    
+    pages = max((total + query.per_page - 1) // query.per_page, 1)
+    prev_link = next_link = ''
+    if query.page > 1:
+        prev_link = f'<a href="{link(page=query.page - 1)}">← Назад</a>'
+    if query.page < pages:
+        next_link = f'<a href="{link(page=query.page + 1)}">Вперед →</a>'
+    sort_links = ' · '.join(
+        f'<a href="{link(sort=sort, page=1)}">{label}</a>'
+        for sort, label in SORT_LABELS.items()
+    )
+    return PAGINATION_TEMPLATE.format(
+        total=total, page=query.page, pages=pages,
+        prev_link=prev_link, next_link=next_link, sort_links=sort_links,
+    )
+
+def generate_grades_section(query=None):
+    """Генерирует изменяемую часть страницы: статистику и таблицу.
+    
+    Без query выводится вся таблица, иначе только строки одной страницы выборки.
+    """
+    if not grades:
+        yield PAGE_EMPTY_STATE
+        yield PAGE_TAIL
+        return
+    
+    # Снимок данных: grades может измениться, пока страница отправляется
+    total_subjects = len(grades)
+    average_grade = grades_total / total_subjects
+    if query is None:
+        items = list(grades.items())
+        offset = 0
+    else:
+        matched, items = grade_index.query(query, grades)
+        offset = query.offset
     
-    response = "HTTP/1.1 200 OK\r\n"
+    yield STATS_TEMPLATE.format(
+        total_subjects=total_subjects, average_grade=average_grade
+    ).encode('utf-8')
+    
+    # Строки таблицы кодируются пачками, без конкатенации всей страницы
+    for start in range(0, len(items), ROWS_PER_CHUNK):
+        batch = items[start:start + ROWS_PER_CHUNK]
+        yield ''.join(
+            ROW_TEMPLATE.format(idx, subject, grade)
+            for idx, (subject, grade) in enumerate(batch, offset + start + 1)
+        ).encode('utf-8')
+    
+    yield TABLE_END
+    if query is not None:
+        yield render_pagination(query, matched).encode('utf-8')
+    yield PAGE_TAIL
+
+def generate_encoded_page(encoding, query=None):
+    """Генерирует страницу в нужном Content-Encoding.
+    
+    Сжимается только динамическая часть: к заранее сжатому PAGE_HEAD
+    дописывается продолжение потока из копии сохраненного компрессора.
+    """
+    if encoding is None:
+        yield from generate_html_page(query)
+        return
+    
+    prefix, template = COMPRESSED_HEADS[encoding]
+    compressor = template.copy()
+    yield prefix
+    for chunk in generate_grades_section(query):
+        data = compressor.compress(chunk)
+        if data:
+            yield data
+    yield compressor.flush()
+
+def negotiate_encoding(accept_encoding):
+    """Выбирает Content-Encoding по заголовку Accept-Encoding (или None)"""
+    if not accept_encoding:
+        return None
+    
+    weights = {}
+    for item in accept_encoding.split(','):
+        name, _, params = item.partition(';')
+        name = name.strip().lower()
+        weight = 1.0
+        params = params.strip()
+        if params.startswith('q='):
+            try:
+                weight = float(params[2:])
+            except ValueError:
+                weight = 0.0
+        weights[name] = weight
+    
+    best = None
+    best_weight = 0.0
+    for encoding in CONTENT_ENCODINGS:
+        weight = weights.get(encoding, weights.get('*', 0.0))
+        if weight > best_weight:
+            best, best_weight = encoding, weight
+    return best
+
+def chunked(chunks):
+    """Оборачивает куски тела в кодирование Transfer-Encoding: chunked"""
+    for chunk in chunks:
+        if chunk:
+            yield b'%x\r\n%s\r\n' % (len(chunk), chunk)
+    yield b'0\r\n\r\n'
+
+def connection_header(keep_alive):
+    """Возвращает заголовок Connection для ответа"""
+    return "Connection: keep-alive\r\n" if keep_alive else "Connection: close\r\n"
+
+def current_etag(encoding=None):
+    """Возвращает сильный ETag текущей версии страницы в данном кодировании"""
+    if encoding is None:
+        return f'"{ETAG_EPOCH}-{grades_generation}"'
+    return f'"{ETAG_EPOCH}-{grades_generation}-{encoding}"'
+
+def etag_matches(if_none_match, etag):
+    """Проверяет заголовок If-None-Match (список ETag или *)"""
+    if if_none_match.strip() == '*':
+        return True
+    for candidate in if_none_match.split(','):
+        candidate = candidate.strip()
+        if candidate.startswith('W/'):
+            candidate = candidate[2:]
+        if candidate == etag:
+            return True
+    return False
+
+def apply_grade(subject, grade):
+    """Обновляет grades, накопленную сумму оценок и индексы"""
+    global grades_total
+    old_grade = grades.get(subject)
+    grades_total += grade - (old_grade or 0)
+    grades[subject] = grade
+    grade_index.update(subject, old_grade, grade)
+
+def validate_grade(subject, grade):
+    """Проверяет пару дисциплина/оценка; возвращает текст ошибки или None"""
+    if not isinstance(subject, str) or not subject:
+        return "дисциплина должна быть непустой строкой"
+    try:
+        size = len(subject.encode('utf-8'))
+    except UnicodeEncodeError:
+        # Одиночные суррогаты из JSON ("\ud800") в журнал не записать
+        return "дисциплина содержит недопустимые символы"
+    if size > MAX_SUBJECT_SIZE:
+        return f"название дисциплины длиннее {MAX_SUBJECT_SIZE} байт"
+    if isinstance(grade, bool) or not isinstance(grade, int):
+        return "оценка должна быть целым числом"
+    if not 2 <= grade <= 5:
+        return f"неверная оценка: {grade}"
+    return None
+
+def set_grade(subject, grade):
+    """Сохраняет оценку и инвалидирует кэш страницы"""
+    set_grades([(subject, grade)])
+
+def set_grades(updates):
+    """Применяет пачку оценок как одно изменение.
+    
+    Версия grades увеличивается, кэш сбрасывается и журнал пишется
+    один раз на всю пачку.
+    """
+    global grades_generation
+    
+    # В режиме pre-fork запись идет через общее хранилище,
+    # а локально изменение применяется в общем порядке номеров
+    if shared_store is not None:
+        shared_store.append(updates)
+        sync_shared_grades()
+        return
+    
+    # Записи журнала кодируются до изменения grades: пачка применяется целиком или никак
+    records = journal.encode_batch(updates) if journal is not None else None
+    
+    for subject, grade in updates:
+        apply_grade(subject, grade)
+    grades_generation += 1
+    clear_caches()
+    
+    if records is not None:
+        journal.append_records(records)
+
+def sync_shared_grades():
+    """Подтягивает изменения, сделанные другими воркерами"""
+    global applied_seq, grades_generation
+    
+    # Одно чтение разделяемой памяти, если ничего не менялось
+    if shared_store.latest_seq == applied_seq:
+        return
+    
+    changes = shared_store.changes_since(applied_seq)
+    if changes is None:
+        seq, state = shared_store.load_all()
+        restore_grades(state)
+    else:
+        for seq, subject, grade in changes:
+            apply_grade(subject, grade)
+        if not changes:
+            return
+    
+    # Номер версии общий для всех воркеров, поэтому и ETag у них совпадает
+    applied_seq = seq
+    grades_generation = seq
+    clear_caches()
+
+def restore_grades(state):
+    """Загружает оценки из журнала или общего хранилища, без повторной записи"""
+    global grades_generation, grades_total
+    grades.clear()
+    grades.update(state)
+    grades_total = sum(grades.values())
+    grade_index.rebuild(grades)
+    grades_generation += 1
+    clear_caches()
+
+def page_headers(status, etag, encoding, keep_alive):
+    """Общие заголовки ответов со страницей"""
+    response = f"HTTP/1.1 {status}\r\n"
     response += "Content-Type: text/html; charset=utf-8\r\n"
-    response += f"Content-Length: {len(html.encode('utf-8'))}\r\n"
-    response += "Connection: close\r\n"
+    if encoding is not None:
+        response += f"Content-Encoding: {encoding}\r\n"
+    response += "Vary: Accept-Encoding\r\n"
+    response += f"ETag: {etag}\r\n"
+    response += "Cache-Control: no-cache\r\n"
+    response += connection_header(keep_alive)
+    return response
+
+def build_page_response(keep_alive, encoding=None, query=None):
+    """Рендерит страницу и собирает полный ответ в байтах"""
+    body = b''.join(generate_encoded_page(encoding, query))
+    
+    response = page_headers("200 OK", current_etag(encoding), encoding, keep_alive)
+    response += f"Content-Length: {len(body)}\r\n"
     response += "\r\n"
-    response += html
     
+    return response.encode('utf-8') + body
+
+def stream_page_response(keep_alive, encoding=None):
+    """Отдает большую страницу потоком кусков без сборки в памяти"""
+    response = page_headers("200 OK", current_etag(encoding), encoding, keep_alive)
+    response += "Transfer-Encoding: chunked\r\n"
+    response += "\r\n"
+    
+    yield response.encode('utf-8')
+    yield from chunked(generate_encoded_page(encoding))
+
+def handle_get_request(request, keep_alive=False):
+    """Обрабатывает GET-запрос.
+    
+    Возвращает байты ответа или, для больших таблиц, генератор кусков.
+    """
+    encoding = negotiate_encoding(request.headers.get('accept-encoding'))
+    etag = current_etag(encoding)
+    
+    # Клиент уже имеет актуальную версию страницы
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and etag_matches(if_none_match, etag):
+        response = page_headers("304 Not Modified", etag, encoding, keep_alive)
+        response += "\r\n"
+        return response.encode('utf-8')
+    
+    # ?sort=grade&min=4&page=3 - рендерятся только строки одной страницы
+    query = parse_grade_query(request.path.partition('?')[2])
+    if query is not None:
+        return cached_response(
+            (grades_generation, keep_alive, encoding, query.key()),
+            lambda: build_page_response(keep_alive, encoding, query),
+            query=True,
+        )
+    
+    # Большие таблицы не кэшируются и идут потоком (HTTP/1.0 не знает chunked)
+    if len(grades) >= STREAM_THRESHOLD and request.version == 'HTTP/1.1':
+        return stream_page_response(keep_alive, encoding)
+    
+    # Страница перерисовывается и сжимается только после изменения grades
+    return cached_response(
+        (grades_generation, keep_alive, encoding),
+        lambda: build_page_response(keep_alive, encoding),
+    )
+
+def clear_caches():
+    """Сбрасывает кэши ответов после изменения grades"""
+    page_cache.clear()
+    query_cache.clear()
+
+def cached_response(key, build, query=False):
+    """Берет ответ из кэша текущей версии grades или строит и запоминает его.
+
+    query=True - ответ на выборку: он идет в query_cache, ограниченный
+    QUERY_CACHE_LIMIT, потому что число разных выборок не ограничено.
+    """
+    cache = query_cache if query else page_cache
+    response = cache.get(key)
+    if response is None:
+        response = build()
+        if not query or len(cache) < QUERY_CACHE_LIMIT:
+            cache[key] = response
     return response
 
-def handle_post_request(body):
+def handle_post_request(body, keep_alive=False):
     """Обрабатывает POST-запрос"""
     try:
         # Парсим данные формы
@@ -335,75 +884,249 @@ def handle_post_request(body):
             grade = int(params['grade'][0])
             
             # Валидация
-            if 2 <= grade <= 5:
-                grades[subject] = grade
-                print(f"[+] Добавлена оценка: {subject} = {grade}")
+            error = validate_grade(subject, grade)
+            if error is None:
+                set_grade(subject, grade)
+                log(f"[+] Добавлена оценка: {subject} = {grade}")
             else:
-                print(f"[!] Неверная оценка: {grade}")
-        
+                print(f"[!] {error}")
+    
     except Exception as e:
         print(f"[!] Ошибка обработки POST-запроса: {e}")
     
     # Возвращаем редирект на главную страницу
     response = "HTTP/1.1 303 See Other\r\n"
     response += "Location: /\r\n"
-    response += "Connection: close\r\n"
+    response += "Content-Length: 0\r\n"
+    response += connection_header(keep_alive)
     response += "\r\n"
     
-    return response
+    return response.encode('utf-8')
 
-def main():
+def json_response(status, data, keep_alive=False, etag=None):
+    """Формирует ответ с телом в JSON"""
+    body = json.dumps(data, ensure_ascii=False).encode('utf-8')
+    
+    response = f"HTTP/1.1 {status}\r\n"
+    response += "Content-Type: application/json; charset=utf-8\r\n"
+    response += f"Content-Length: {len(body)}\r\n"
+    if etag is not None:
+        response += f"ETag: {etag}\r\n"
+        response += "Cache-Control: no-cache\r\n"
+    response += connection_header(keep_alive)
+    response += "\r\n"
+    
+    return response.encode('utf-8') + body
+
+def parse_grade_records(body, content_type):
+    """Разбирает тело импорта: JSON-массив или NDJSON (объект на строку)"""
+    text = body.decode('utf-8')
+    if 'ndjson' in content_type or 'jsonl' in content_type or not text.lstrip().startswith('['):
+        # NDJSON разбирается построчно, без загрузки всего документа одним объектом
+        return [json.loads(line) for line in text.splitlines() if line.strip()]
+    
+    records = json.loads(text)
+    if not isinstance(records, list):
+        raise ValueError("ожидается массив записей")
+    return records
+
+def handle_api_get(request, keep_alive=False):
+    """GET /api/grades: оценки и статистика в JSON"""
+    etag = current_etag('json')
+    
+    if_none_match = request.headers.get('if-none-match')
+    if if_none_match and etag_matches(if_none_match, etag):
+        response = "HTTP/1.1 304 Not Modified\r\n"
+        response += f"ETag: {etag}\r\n"
+        response += "Cache-Control: no-cache\r\n"
+        response += connection_header(keep_alive)
+        response += "\r\n"
+        return response.encode('utf-8')
+    
+    query = parse_grade_query(request.path.partition('?')[2])
+    
+    def build():
+        count = len(grades)
+        data = {
+            'count': count,
+            'average': grades_total / count if count else 0,
+        }
+        if query is None:
+            items = grades.items()
+        else:
+            matched, items = grade_index.query(query, grades)
+            data['matched'] = matched
+            data['page'] = query.page
+            data['per_page'] = query.per_page
+        data['grades'] = [{'subject': subject, 'grade': grade} for subject, grade in items]
+        return json_response("200 OK", data, keep_alive, etag)
+    
+    key = (grades_generation, keep_alive, 'json', query.key() if query else None)
+    return cached_response(key, build, query=query is not None)
+
+def handle_api_post(request, keep_alive=False):
+    """POST /api/grades: импорт пачки оценок (все или ничего)"""
+    try:
+        records = parse_grade_records(request.body, request.headers.get('content-type', ''))
+    except ValueError as e:
+        # json.JSONDecodeError и UnicodeDecodeError - подклассы ValueError
+        return json_response("400 Bad Request", {'error': f"неверный JSON: {e}"}, keep_alive)
+    
+    updates = []
+    errors = []
+    for index, record in enumerate(records):
+        if not isinstance(record, dict):
+            errors.append({'index': index, 'error': "запись должна быть объектом"})
+            continue
+        subject = record.get('subject')
+        grade = record.get('grade')
+        error = validate_grade(subject, grade)
+        if error is not None:
+            errors.append({'index': index, 'error': error})
+        else:
+            updates.append((subject, grade))
+    
+    if errors:
+        return json_response("422 Unprocessable Entity", {'errors': errors}, keep_alive)
+    
+    if updates:
+        set_grades(updates)
+        log(f"[+] Импортировано оценок: {len(updates)}")
+    
+    return json_response("200 OK", {'applied': len(updates), 'count': len(grades)}, keep_alive)
+
+def log(message):
+    """Печатает сообщение, если не включен тихий режим"""
+    if verbose:
+        print(message)
+
+def error_response(status, reason):
+    """Формирует короткий ответ об ошибке и закрывает соединение"""
+    return (f"HTTP/1.1 {status} {reason}\r\n"
+            "Content-Length: 0\r\n"
+            "Connection: close\r\n"
+            "\r\n").encode('utf-8')
+
+def dispatch_request(request, keep_alive=False):
+    """Выбирает обработчик по пути и HTTP-методу"""
+    if shared_store is not None:
+        sync_shared_grades()
+    
+    path = request.path.split('?', 1)[0]
+    if path == STATS_PATH and request.method == 'GET':
+        return json_response("200 OK", connection_stats, keep_alive)
+    
+    if path == API_GRADES_PATH:
+        if request.method == 'GET':
+            return handle_api_get(request, keep_alive)
+        if request.method == 'POST':
+            return handle_api_post(request, keep_alive)
+    else:
+        if request.method == 'GET':
+            return handle_get_request(request, keep_alive)
+        if request.method == 'POST':
+            try:
+                body = request.body.decode('utf-8')
+            except UnicodeDecodeError:
+                # Как и в /api/grades: тело не в UTF-8 - ошибка клиента, а не 500
+                return ("HTTP/1.1 400 Bad Request\r\n"
+                        "Content-Length: 0\r\n" + connection_header(keep_alive) + "\r\n").encode('utf-8')
+            return handle_post_request(body, keep_alive)
+    return ("HTTP/1.1 405 Method Not Allowed\r\n"
+            "Content-Length: 0\r\n" + connection_header(keep_alive) + "\r\n").encode('utf-8')
+
+def serve_legacy(host, port, reuse_port=False):
+    """Классический цикл: одно соединение за раз, Connection: close"""
     # Создаем TCP сокет
     server_socket = socket.socket(socket.AF_INET, socket.SOCK_STREAM)
     
     # Позволяем переиспользовать адрес
     server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEADDR, 1)
     
-    # Настройки сервера
-    host = 'localhost'
-    port = 8000
+    # В режиме pre-fork каждый воркер слушает тот же порт,
+    # а ядро распределяет входящие соединения между ними
+    if reuse_port:
+        server_socket.setsockopt(socket.SOL_SOCKET, socket.SO_REUSEPORT, 1)
     
     # Привязываем сокет к адресу и порту
     server_socket.bind((host, port))
     
     # Начинаем прослушивание
-    server_socket.listen(5)
+    server_socket.listen(listen_backlog)
     
     print("=" * 60)
-    print(f"Веб-сервер для журнала оценок запущен")
+    print(f"Веб-сервер для журнала оценок запущен (режим: legacy)")
     print(f"Откройте в браузере: http://{host}:{port}")
     print("=" * 60)
     print("Для остановки нажмите Ctrl+C\n")
     
+    # Приемный буфер переиспользуется между соединениями
+    recv_buffer = bytearray(RECV_BUFFER_SIZE)
+    recv_view = memoryview(recv_buffer)
+    
     try:
         while True:
             # Принимаем подключение
             client_socket, client_address = server_socket.accept()
+            connection_stats['accepted'] += 1
+            parser = RequestParser(body_limits=BODY_LIMITS)
             
             try:
-                # Получаем HTTP-запрос
-                request = client_socket.recv(4096).decode('utf-8')
+                # Читаем из сокета, пока не придет полный запрос,
+                # но не дольше read_timeout: медленный клиент не держит весь цикл
+                request = None
+                deadline = time.monotonic() + read_timeout
+                while request is None:
+                    client_socket.settimeout(max(deadline - time.monotonic(), 0.001))
+                    received = client_socket.recv_into(recv_buffer)
+                    if received == 0:
+                        break
+                    parser.feed(recv_view[:received])
+                    request = parser.next_request()
                 
-                # Парсим запрос
-                method, path, body = parse_request(request)
+                if request is None:
+                    continue
                 
-                print(f"[{method}] {path} от {client_address}")
+                log(f"[{request.method}] {request.path} от {client_address}")
                 
                 # Обрабатываем запрос
-                if method == 'GET':
-                    response = handle_get_request()
-                elif method == 'POST':
-                    response = handle_post_request(body)
-                else:
-                    response = "HTTP/1.1 405 Method Not Allowed\r\n\r\n"
+                response = dispatch_request(request)
                 
                 # Отправляем ответ
-                client_socket.send(response.encode('utf-8'))
-                
+                client_socket.settimeout(write_timeout)
+                if isinstance(response, bytes):
+                    client_socket.sendall(response)
+                else:
+                    for chunk in response:
+                        client_socket.sendall(chunk)
+            
+            except HTTPError as e:
+                log(f"[!] Некорректный запрос от {client_address}: {e}")
+                # Клиент мог уже сбросить соединение - это не должно останавливать цикл
+                try:
+                    client_socket.sendall(error_response(e.status, e.reason))
+                except OSError:
+                    pass
+            
+            except TimeoutError:
+                connection_stats['timed_out'] += 1
+                log(f"[!] Истекло время ожидания клиента {client_address}")
+                # Запрос так и не пришел целиком - сообщаем об этом клиенту
+                if request is None:
+                    try:
+                        client_socket.sendall(error_response(408, "Request Timeout"))
+                    except OSError:
+                        pass
+            
+            except ConnectionError:
+                log(f"[!] Клиент {client_address} разорвал соединение")
+            
             except Exception as e:
                 print(f"[!] Ошибка обработки запроса: {e}")
-                error_response = "HTTP/1.1 500 Internal Server Error\r\n\r\n"
-                client_socket.send(error_response.encode('utf-8'))
+                try:
+                    client_socket.sendall(error_response(500, "Internal Server Error"))
+                except OSError:
+                    pass
             
             finally:
                 client_socket.close()
@@ -412,7 +1135,280 @@ def main():
         print("\n\nОстановка сервера...")
     finally:
         server_socket.close()
+        print(f"Счетчики соединений: {connection_stats}")
+        print("Сервер остановлен")
+
+async def drain_before(writer, deadline):
+    """Ждет отправки буфера, но не дольше общего срока на ответ"""
+    timeout = deadline - asyncio.get_running_loop().time()
+    await asyncio.wait_for(writer.drain(), max(timeout, 0))
+
+async def handle_connection(reader, writer):
+    """Обслуживает одно постоянное HTTP/1.1 соединение (с конвейеризацией)"""
+    client_address = writer.get_extra_info('peername')
+    
+    # Контроль допуска: сверх лимита сразу отвечаем 503 и закрываем
+    if connection_stats['active'] >= max_connections:
+        connection_stats['rejected'] += 1
+        writer.write(OVERLOAD_RESPONSE)
+        writer.close()
+        return
+    
+    connection_stats['accepted'] += 1
+    connection_stats['active'] += 1
+    loop = asyncio.get_running_loop()
+    parser = RequestParser(body_limits=BODY_LIMITS)
+    deadline = None
+    
+    try:
+        while True:
+            # Конвейерные запросы уже лежат в буфере парсера
+            # и обрабатываются по порядку без лишнего чтения из сокета
+            request = parser.next_request()
+            if request is None:
+                # Между запросами ждем KEEPALIVE_TIMEOUT, а начатый запрос
+                # должен прийти целиком за read_timeout (защита от slowloris)
+                if parser.has_partial_request():
+                    if deadline is None:
+                        deadline = loop.time() + read_timeout
+                    timeout = max(deadline - loop.time(), 0)
+                else:
+                    timeout = KEEPALIVE_TIMEOUT
+                
+                try:
+                    data = await asyncio.wait_for(reader.read(RECV_BUFFER_SIZE), timeout)
+                except asyncio.TimeoutError:
+                    if parser.has_partial_request():
+                        connection_stats['timed_out'] += 1
+                        log(f"[!] Истекло время ожидания запроса от {client_address}")
+                        writer.write(error_response(408, "Request Timeout"))
+                    break
+                if not data:
+                    break
+                parser.feed(data)
+                continue
+            
+            deadline = None
+            keep_alive = request.keep_alive
+            log(f"[{request.method}] {request.path} от {client_address}")
+            
+            try:
+                response = dispatch_request(request, keep_alive)
+            except Exception as e:
+                print(f"[!] Ошибка обработки запроса: {e}")
+                response = error_response(500, "Internal Server Error")
+                keep_alive = False
+            
+            write_deadline = loop.time() + write_timeout
+            if isinstance(response, bytes):
+                writer.write(response)
+                await drain_before(writer, write_deadline)
+            else:
+                # Потоковый ответ: ждем освобождения буфера после каждого куска
+                for chunk in response:
+                    writer.write(chunk)
+                    await drain_before(writer, write_deadline)
+            
+            if not keep_alive:
+                break
+    
+    except HTTPError as e:
+        log(f"[!] Некорректный запрос от {client_address}: {e}")
+        writer.write(error_response(e.status, e.reason))
+    except asyncio.TimeoutError:
+        connection_stats['timed_out'] += 1
+        log(f"[!] Клиент {client_address} не принимает ответ, соединение закрыто")
+    except ConnectionError as e:
+        log(f"[!] Соединение {client_address} прервано: {e}")
+    except asyncio.CancelledError:
+        # Сервер останавливается: просто закрываем соединение
+        pass
+    finally:
+        connection_stats['active'] -= 1
+        writer.close()
+        try:
+            await writer.wait_closed()
+        except ConnectionError:
+            pass
+
+async def serve_async(host, port, reuse_port=False):
+    """Асинхронный режим: keep-alive, конвейеризация, тысячи соединений"""
+    server = await asyncio.start_server(
+        handle_connection, host, port, backlog=listen_backlog, reuse_port=reuse_port
+    )
+    
+    print("=" * 60)
+    print(f"Веб-сервер для журнала оценок запущен (режим: async)")
+    print(f"Откройте в браузере: http://{host}:{port}")
+    print("=" * 60)
+    print("Для остановки нажмите Ctrl+C\n")
+    
+    try:
+        async with server:
+            await server.serve_forever()
+    finally:
+        print(f"Счетчики соединений: {connection_stats}")
+
+def run_server(args, reuse_port=False):
+    """Запускает выбранный режим обслуживания соединений"""
+    if args.mode == 'async':
+        try:
+            asyncio.run(serve_async(args.host, args.port, reuse_port))
+        except KeyboardInterrupt:
+            print("\n\nОстановка сервера...")
+            print("Сервер остановлен")
+    else:
+        serve_legacy(args.host, args.port, reuse_port)
+
+def run_worker(args, db_path, counter):
+    """Тело воркера: свое подключение к общему хранилищу и свой сокет"""
+    global shared_store, applied_seq, grades_generation
+    
+    shared_store = SharedGradeStore(db_path, counter)
+    applied_seq, state = shared_store.load_all()
+    restore_grades(state)
+    grades_generation = applied_seq
+    
+    try:
+        run_server(args, reuse_port=True)
+    finally:
+        shared_store.close()
+
+def spawn_worker(args, db_path, counter):
+    """Создает процесс-воркер через fork; возвращает его pid"""
+    pid = os.fork()
+    if pid == 0:
+        code = 0
+        try:
+            run_worker(args, db_path, counter)
+        except KeyboardInterrupt:
+            pass
+        except Exception as e:
+            print(f"[!] Воркер {os.getpid()} упал: {e}")
+            code = 1
+        finally:
+            os._exit(code)
+    return pid
+
+def import_journal(data_dir, db_path, counter):
+    """Переносит оценки из журнала однопроцессного режима в новое хранилище SQLite.
+
+    Выполняется один раз, когда каталог с журналом впервые запускается
+    с --workers; дальше воркеры работают только с хранилищем.
+    """
+    if os.path.exists(db_path):
+        return
+    state = GradeJournal(data_dir).load()
+    if not state:
+        return
+    store = SharedGradeStore(db_path, counter)
+    try:
+        store.append(list(state.items()))
+    finally:
+        store.close()
+    print(f"Оценки из журнала {data_dir} перенесены в хранилище: {len(state)}")
+
+def run_prefork(args):
+    """Супервизор: запускает N воркеров на одном порту и перезапускает упавших"""
+    # Счетчик версий в разделяемой памяти; наследуется воркерами при fork
+    counter = multiprocessing.Value('Q', 0)
+    
+    if args.data_dir:
+        os.makedirs(args.data_dir, exist_ok=True)
+        db_path = os.path.join(args.data_dir, 'grades.sqlite3')
+        import_journal(args.data_dir, db_path, counter)
+        temp_dir = None
+    else:
+        # Без --data-dir оценки, как и раньше, живут только до остановки сервера
+        temp_dir = tempfile.TemporaryDirectory(prefix='grades-')
+        db_path = os.path.join(temp_dir.name, 'grades.sqlite3')
+    
+    print(f"Супервизор {os.getpid()}: запуск {args.workers} воркеров, хранилище {db_path}")
+    
+    workers = {}
+    for _ in range(args.workers):
+        workers[spawn_worker(args, db_path, counter)] = time.monotonic()
+    
+    try:
+        while True:
+            pid, status = os.wait()
+            started = workers.pop(pid, None)
+            if started is None:
+                continue
+            
+            print(f"[!] Воркер {pid} завершился (код {os.waitstatus_to_exitcode(status)}), перезапуск")
+            
+            # Не перезапускаем в цикле воркер, который падает сразу при старте
+            if time.monotonic() - started < RESPAWN_DELAY:
+                time.sleep(RESPAWN_DELAY)
+            workers[spawn_worker(args, db_path, counter)] = time.monotonic()
+    
+    except KeyboardInterrupt:
+        print("\n\nОстановка воркеров...")
+    finally:
+        for pid in workers:
+            try:
+                os.kill(pid, signal.SIGTERM)
+            except ProcessLookupError:
+                pass
+        for pid in workers:
+            try:
+                os.waitpid(pid, 0)
+            except ChildProcessError:
+                pass
+        if temp_dir is not None:
+            temp_dir.cleanup()
         print("Сервер остановлен")
 
+def main():
+    global verbose, journal, read_timeout, write_timeout, max_connections, listen_backlog
+    
+    parser = argparse.ArgumentParser(description="Веб-сервер журнала оценок")
+    parser.add_argument('--mode', choices=['legacy', 'async'], default='legacy',
+                        help="legacy - одно соединение за раз, async - asyncio с keep-alive")
+    parser.add_argument('--host', default='localhost')
+    parser.add_argument('--port', type=int, default=8000)
+    parser.add_argument('-q', '--quiet', action='store_true',
+                        help="не печатать строку на каждый запрос (для замеров)")
+    parser.add_argument('--data-dir',
+                        help="каталог для журнала и снапшотов (по умолчанию оценки только в памяти)")
+    parser.add_argument('--workers', type=int, default=1,
+                        help="число процессов-воркеров на одном порту (SO_REUSEPORT)")
+    parser.add_argument('--read-timeout', type=float, default=READ_TIMEOUT,
+                        help="секунд на получение запроса целиком")
+    parser.add_argument('--write-timeout', type=float, default=WRITE_TIMEOUT,
+                        help="секунд на отправку ответа")
+    parser.add_argument('--max-connections', type=int, default=MAX_CONNECTIONS,
+                        help="лимит одновременных соединений (async), сверх него - 503")
+    parser.add_argument('--backlog', type=int, default=LISTEN_BACKLOG,
+                        help="длина очереди listen()")
+    args = parser.parse_args()
+    
+    verbose = not args.quiet
+    read_timeout = args.read_timeout
+    write_timeout = args.write_timeout
+    max_connections = args.max_connections
+    listen_backlog = args.backlog
+    
+    if args.workers > 1:
+        run_prefork(args)
+        return
+    
+    if args.data_dir:
+        if os.path.exists(os.path.join(args.data_dir, 'grades.sqlite3')):
+            # Изменения, сделанные с --workers, лежат только в SQLite
+            print(f"[!] В {args.data_dir} есть хранилище режима --workers; "
+                  f"его изменения в однопроцессном режиме не видны")
+        journal = GradeJournal(args.data_dir)
+        restore_grades(journal.load())
+        journal.start(lambda: dict(grades))
+        print(f"Загружено оценок из {args.data_dir}: {len(grades)}")
+    
+    try:
+        run_server(args)
+    finally:
+        if journal is not None:
+            journal.close()
+
 if __name__ == "__main__":
     main()
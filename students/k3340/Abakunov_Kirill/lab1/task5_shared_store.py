@@ -0,0 +1,112 @@
+#!/usr/bin/env python3
+"""
+Задание 5: Общее хранилище оценок для нескольких процессов
+SQLite в режиме WAL + счетчик версий в разделяемой памяти
+"""
+
+import sqlite3
+
+# Сколько последних изменений хранится в логе для догоняющих воркеров
+LOG_RETENTION = 10000
+
+# Как часто (в записях) удалять старые строки лога
+COMPACT_EVERY = 1000
+
+SCHEMA = """
+CREATE TABLE IF NOT EXISTS grades (
+    subject TEXT PRIMARY KEY,
+    grade INTEGER NOT NULL
+);
+CREATE TABLE IF NOT EXISTS grade_log (
+    seq INTEGER PRIMARY KEY AUTOINCREMENT,
+    subject TEXT NOT NULL,
+    grade INTEGER NOT NULL
+);
+"""
+
+class SharedGradeStore:
+    """Хранилище оценок, общее для всех воркеров.
+
+    Каждое изменение записывается в таблицу grades и в лог grade_log
+    с монотонным номером seq. Последний seq публикуется в счетчике
+    в разделяемой памяти (multiprocessing.Value, создается до fork),
+    поэтому воркер на каждом запросе одним чтением памяти узнает, есть ли
+    чужие изменения, и забирает из лога только новые строки.
+    """
+    
+    def __init__(self, path, counter):
+        self.counter = counter
+        self.connection = sqlite3.connect(path, timeout=5.0, isolation_level=None)
+        self.connection.execute("PRAGMA journal_mode=WAL")
+        self.connection.execute("PRAGMA synchronous=NORMAL")
+        self.connection.executescript(SCHEMA)
+        self.appended = 0
+    
+    @property
+    def latest_seq(self):
+        """Номер последнего изменения среди всех воркеров"""
+        return self.counter.value
+    
+    def load_all(self):
+        """Читает все оценки; возвращает (seq, {дисциплина: оценка})"""
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN")
+        try:
+            seq = cursor.execute("SELECT COALESCE(MAX(seq), 0) FROM grade_log").fetchone()[0]
+            state = dict(cursor.execute("SELECT subject, grade FROM grades"))
+        finally:
+            cursor.execute("COMMIT")
+        self.publish(seq)
+        return seq, state
+    
+    def append(self, updates):
+        """Записывает пачку изменений одной транзакцией; возвращает новый seq"""
+        cursor = self.connection.cursor()
+        cursor.execute("BEGIN IMMEDIATE")
+        try:
+            cursor.executemany(
+                "INSERT INTO grades (subject, grade) VALUES (?, ?) "
+                "ON CONFLICT(subject) DO UPDATE SET grade = excluded.grade",
+                updates,
+            )
+            cursor.executemany(
+                "INSERT INTO grade_log (subject, grade) VALUES (?, ?)", updates
+            )
+            seq = cursor.execute("SELECT MAX(seq) FROM grade_log").fetchone()[0]
+            
+            self.appended += len(updates)
+            if self.appended >= COMPACT_EVERY:
+                cursor.execute("DELETE FROM grade_log WHERE seq <= ?", (seq - LOG_RETENTION,))
+                self.appended = 0
+        except BaseException:
+            cursor.execute("ROLLBACK")
+            raise
+        cursor.execute("COMMIT")
+        
+        self.publish(seq)
+        return seq
+    
+    def changes_since(self, seq):
+        """Изменения после seq по порядку.
+
+        Возвращает None, если нужные строки лога уже удалены
+        и воркеру надо перечитать все через load_all().
+        """
+        rows = self.connection.execute(
+            "SELECT seq, subject, grade FROM grade_log WHERE seq > ? ORDER BY seq", (seq,)
+        ).fetchall()
+        if rows and rows[0][0] == seq + 1:
+            return rows
+        if not rows and seq >= self.latest_seq:
+            return rows
+        # Пропуск в номерах: часть лога уже удалена при сжатии
+        return None
+    
+    def publish(self, seq):
+        """Поднимает общий счетчик версий до seq"""
+        with self.counter.get_lock():
+            if seq > self.counter.value:
+                self.counter.value = seq
+    
+    def close(self):
+        self.connection.close()